@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Time `ishu list` on synthetic in-memory trackers of increasing size.
+
+The issues are generated in memory and handed straight to cmd_list, so
+this only measures the blocking detection, filtering and rendering, not
+the loading. The time per issue should stay roughly constant.
+
+Usage: python benchmarks/list_blocking.py [size...]
+"""
+import contextlib
+from datetime import datetime, timedelta, timezone
+import io
+import random
+import sys
+import time
+from typing import Iterator, List, Optional, Set, Tuple
+
+from ishu import commands
+from ishu.common import Config
+from ishu.models import (blocking_map, Issue, IssueFilter, IssueID,
+                         IssueSort, IssueStatus, sort_lazily)
+
+
+def make_issues(count: int, blocked_ratio: float = 0.1) -> List[Issue]:
+    rng = random.Random(count)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    issues = []
+    for num in range(1, count + 1):
+        created = start + timedelta(minutes=num)
+        blocked_by = set()
+        if num > 1 and rng.random() < blocked_ratio:
+            blocked_by.add(IssueID('bench', rng.randrange(1, num)))
+        status = rng.choice(list(IssueStatus))
+        tags = {f'tag{rng.randrange(20)}'}
+        issues.append(Issue(
+            id_=IssueID('bench', num), created=created, updated=created,
+            description=f'Issue number {num}', tags=tags,
+            blocked_by=blocked_by, comment_count=0, status=status))
+    return issues
+
+
+def time_list(issues: List[Issue], args: List[str]) -> float:
+    def iter_issues_and_blockers(
+            issue_filter: IssueFilter, sort: Optional[IssueSort] = None
+            ) -> Tuple[Iterator[Issue], Set[IssueID]]:
+        matching = (i for i in issues if issue_filter.matches(i))
+        return (matching if sort is None else sort_lazily(matching, sort),
+                set(blocking_map(issues)))
+
+    commands.iter_issues_and_blockers = iter_issues_and_blockers
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        commands.cmd_list(Config('bench'), list(args))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    print(f'{"issues":>8}  {"args":<8}  {"total (s)":>10}  '
+          f'{"per issue (us)":>14}')
+    for size in sizes:
+        issues = make_issues(size)
+        for args in ([], ['-B'], ['-b'], ['-n']):
+            elapsed = time_list(issues, args)
+            print(f'{size:>8}  {" ".join(args):<8}  {elapsed:>10.3f}  '
+                  f'{elapsed / size * 1e6:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Compare the memory used by loaded issues with the old NamedTuple model.
+
+The same synthetic issue files are decoded with json and turned into
+issues by both models, and everything that's still allocated afterwards
+is counted with tracemalloc.
+
+Usage: python benchmarks/memory.py [issues]
+"""
+from datetime import datetime
+import gc
+import json
+import random
+import sys
+import tracemalloc
+from typing import (Any, Callable, Dict, FrozenSet, List, NamedTuple, Set,
+                    Tuple)
+
+from ishu.common import parse_timestamp
+from ishu.models import Issue, IssueID, IssueStatus
+from suite import STATUS_WEIGHTS
+
+
+class OldIssue(NamedTuple):
+    id_: IssueID
+    created: datetime
+    updated: datetime
+    description: str
+    tags: Set[str]
+    blocked_by: Set[IssueID]
+    comment_count: int
+    status: IssueStatus
+    original_description: str
+    original_tags: FrozenSet[str]
+    original_blocked_by: FrozenSet[IssueID]
+    original_status: IssueStatus
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any],
+                  comment_count: int) -> 'OldIssue':
+        blocked_by = {IssueID(num=i['id'], user=i['user'])
+                      for i in data['blocked_by']}
+        return cls(id_=IssueID(num=data['id'], user=data['user']),
+                   created=parse_timestamp(data['created']),
+                   updated=parse_timestamp(data['updated']),
+                   description=data['description'],
+                   tags=set(data['tags']),
+                   blocked_by=blocked_by,
+                   comment_count=comment_count,
+                   status=IssueStatus(data['status']),
+                   original_description=data['description'],
+                   original_tags=frozenset(data['tags']),
+                   original_blocked_by=frozenset(blocked_by),
+                   original_status=IssueStatus(data['status']))
+
+
+def make_files(count: int) -> List[str]:
+    rng = random.Random(count)
+    users = ['alice', 'bob', 'carol', 'dave']
+    tags = [f'tag{n}' for n in range(30)]
+    statuses = [s.value for s in IssueStatus]
+    files = []
+    for num in range(1, count + 1):
+        blocked_by = []
+        if num > 1 and rng.random() < 0.1:
+            blocked_by.append({'id': rng.randrange(1, num),
+                               'user': rng.choice(users)})
+        files.append(json.dumps({
+            'id': num,
+            'user': rng.choice(users),
+            'created': '2020-01-01T12:00:00+0000',
+            'updated': '2020-02-01T12:00:00+0000',
+            'description': f'Issue number {num} ' + 'x' * rng.randrange(80),
+            'tags': rng.sample(tags, rng.randrange(4)),
+            'blocked_by': blocked_by,
+            'status': rng.choices(statuses, STATUS_WEIGHTS)[0],
+        }))
+    return files
+
+
+def measure(from_data: Callable[[Dict[str, Any], int], Any],
+            files: List[str]) -> Tuple[int, float]:
+    gc.collect()
+    tracemalloc.start()
+    issues = [from_data(json.loads(text), 0) for text in files]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del issues
+    return size, size / len(files)
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    files = make_files(count)
+    print(f'{"model":<10}  {"total (MB)":>10}  {"per issue (B)":>13}')
+    results = {}
+    for name, from_data in [('old', OldIssue.from_data),
+                            ('compact', Issue.from_data)]:
+        total, per_issue = measure(from_data, files)
+        results[name] = total
+        print(f'{name:<10}  {total / 1e6:>10.1f}  {per_issue:>13.0f}')
+    print(f'\ncompact uses {results["compact"] / results["old"]:.0%} '
+          f'of the memory of the old model')
+
+
+if __name__ == '__main__':
+    main()
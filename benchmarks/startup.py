@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Time how long ishu takes to start and run quick commands.
+
+Every command is run in a new process against a small tracker in a
+temporary directory, a few times with -X importtime to see how much of
+it is spent importing, and a few more times for the wall-clock time.
+The best of each, and the number of modules imported, is checked
+against the budget in startup_budget.json, and anything that's over it
+makes this fail. Times vary a lot between machines and runs, but the
+number of modules doesn't, so that's the one that catches a command
+accidentally importing everything again.
+
+Usage: python benchmarks/startup.py [--update] [runs]
+
+--update writes the current times (with some headroom) as the new budget.
+"""
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from suite import root_env
+
+BUDGET_PATH = Path(__file__).parent / 'startup_budget.json'
+# Machines and runs vary, so only fail when things are clearly slower
+HEADROOM = 2
+MODULE_HEADROOM = 5
+
+COMMANDS: List[List[str]] = [
+    ['init'],
+    ['conf'],
+    ['alias'],
+    ['list'],
+    ['list', '-s', 'open'],
+    ['show', '1'],
+    ['log'],
+    ['tag', '-l'],
+]
+
+
+def run(args: List[str], env: Dict[str, str],
+        flags: Tuple[str, ...] = ()) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *flags, '-m', 'ishu.ishu', *args],
+                          env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def import_ms(stderr: str) -> Tuple[float, int]:
+    # Lines look like "import time: self | cumulative | name", and only
+    # the unindented names are imported directly, everything else is
+    # already counted in their cumulative times
+    total = 0
+    count = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        count += 1
+        if not parts[2].startswith('  '):
+            total += int(parts[1])
+    return total / 1000, count
+
+
+def make_tracker(env: Dict[str, str]) -> None:
+    config_dir = Path(env['HOME']) / '.config'
+    config_dir.mkdir(parents=True)
+    (config_dir / 'ishu.conf').write_text(json.dumps({'user': 'bench'}))
+    os.mkdir(Path(env['ISHUROOT']) / '.ishu')
+    for num in range(20):
+        run(['open', '-t', f'tag{num % 3}', f'Issue {num}'], env)
+
+
+def measure(runs: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = root_env(Path(tmp) / 'root', HOME=os.path.join(tmp, 'home'))
+        os.mkdir(env['ISHUROOT'])
+        make_tracker(env)
+        # Don't get the first run of list to build the index
+        run(['list'], env)
+        for args in COMMANDS:
+            imports = []
+            times = []
+            for _ in range(runs):
+                result = run(args, env, ('-X', 'importtime'))
+                if result.returncode != 0:
+                    sys.exit(f'ishu {" ".join(args)} failed:\n'
+                             f'{result.stderr}')
+                imports.append(import_ms(result.stderr))
+                start = time.perf_counter()
+                run(args, env)
+                times.append((time.perf_counter() - start) * 1000)
+            # Anything slower than the best run is just noise from
+            # whatever else the machine is doing
+            results[' '.join(args)] = {'wall_ms': min(times),
+                                       'import_ms': min(imports)[0],
+                                       'modules': imports[0][1]}
+    return results
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    update = '--update' in args
+    if update:
+        args.remove('--update')
+    runs = int(args[0]) if args else 5
+    # Python itself, for comparison
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'])
+    baseline = (time.perf_counter() - start) * 1000
+    results = measure(runs)
+    if update:
+        BUDGET_PATH.write_text(json.dumps(
+            {name: {'wall_ms': round(r['wall_ms'] * HEADROOM),
+                    'import_ms': round(r['import_ms'] * HEADROOM),
+                    'modules': int(r['modules']) + MODULE_HEADROOM}
+             for name, r in results.items()}, indent=2) + '\n')
+        print(f'Budget written to {BUDGET_PATH}')
+    budget = (json.loads(BUDGET_PATH.read_text())
+              if BUDGET_PATH.exists() else {})
+    print(f'python -c pass: {baseline:.0f} ms\n')
+    print(f'{"command":<16}  {"wall (ms)":>9}  {"budget":>6}  '
+          f'{"imports (ms)":>12}  {"budget":>6}  {"modules":>7}  '
+          f'{"budget":>6}')
+    failed = False
+    for name, r in results.items():
+        limits = budget.get(name, {})
+        over = [key for key, limit in limits.items() if r[key] > limit]
+        failed = failed or bool(over)
+        print(f'{name:<16}  {r["wall_ms"]:>9.0f}  '
+              f'{limits.get("wall_ms", "-"):>6}  {r["import_ms"]:>12.1f}  '
+              f'{limits.get("import_ms", "-"):>6}  {r["modules"]:>7}  '
+              f'{limits.get("modules", "-"):>6}'
+              + ('  OVER BUDGET' if over else ''))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
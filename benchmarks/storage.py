@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Check that every storage backend behaves the same, then time them.
+
+Each backend gets its own empty root in a temporary directory, and is
+run in a separate process. A backend that fails any of the checks isn't timed.
+
+Usage: python benchmarks/storage.py [issues] [backend...]
+"""
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from suite import root_env
+
+BACKENDS = ['directory', 'pack', 'sqlite']
+
+
+def make_storage(backend: str) -> Any:
+    from ishu.common import PACK_PATH, SQLITE_PATH
+    from ishu.storage import DirectoryStorage, PackStorage, SQLiteStorage
+    if backend == 'directory':
+        return DirectoryStorage()
+    elif backend == 'pack':
+        return PackStorage(PACK_PATH)
+    else:
+        return SQLiteStorage(SQLITE_PATH)
+
+
+def issue_data(user: str, num: int, description: str = '') -> Dict[str, Any]:
+    return {'id': num, 'user': user,
+            'created': '2020-01-01T12:00:00+0000',
+            'updated': '2020-01-01T12:00:00+0000',
+            'description': description or f'Issue {num}',
+            'tags': ['a', 'b'], 'blocked_by': [], 'status': 'open'}
+
+
+def comment_data(user: str, num: int, message: str) -> Dict[str, Any]:
+    return {'issue_id': {'user': user, 'num': str(num)}, 'user': user,
+            'created': '2020-01-02T12:00:00+0000', 'message': message}
+
+
+# == Conformance ==
+
+def check_empty(backend: str) -> None:
+    storage = make_storage(backend)
+    assert storage.issue_ids() == []
+    assert not storage.issue_exists('alice', 1)
+    try:
+        storage.read_issue('alice', 1)
+    except FileNotFoundError:
+        pass
+    else:
+        raise AssertionError('read_issue of a missing issue')
+    assert storage.comment_count('alice', 1) == 0
+    assert storage.read_comments('alice', 1) == []
+    assert storage.read_log('alice', 1) == []
+    assert storage.read_tags() == frozenset()
+
+
+def check_allocate(backend: str) -> None:
+    storage = make_storage(backend)
+    first = storage.allocate_id('alice')
+    second = storage.allocate_id('alice')
+    assert second > first, (first, second)
+    assert storage.allocate_id('bob') == 1
+    assert {'alice', 'bob'}.issubset(storage.users())
+    # The counter must never hand out an ID that's already used
+    storage.write_issue('carol', 5, issue_data('carol', 5))
+    assert storage.allocate_id('carol') > 5
+
+
+def check_issues(backend: str) -> None:
+    storage = make_storage(backend)
+    for num in (1, 2, 10):
+        storage.allocate_id('dave')
+        storage.write_issue('dave', num, issue_data('dave', num))
+    storage.write_issue('dave', 2, issue_data('dave', 2, 'changed ünïcode'))
+    assert storage.read_issue('dave', 2)['description'] == 'changed ünïcode'
+    assert storage.read_issue('dave', 10) == issue_data('dave', 10)
+    assert storage.issue_exists('dave', 10)
+    ids = storage.issue_ids('dave')
+    assert [num for _, num in ids if num in (1, 2, 10)] == [1, 2, 10], ids
+    assert ('dave', 2) in storage.issue_ids()
+
+
+def check_comments_and_log(backend: str) -> None:
+    storage = make_storage(backend)
+    num = storage.allocate_id('erin')
+    storage.write_issue('erin', num, issue_data('erin', num))
+    storage.add_comment('erin', num, comment_data('erin', num, 'one'))
+    # Same timestamp on purpose
+    storage.add_comment('erin', num, comment_data('erin', num, 'two'))
+    assert storage.comment_count('erin', num) == 2
+    assert sorted(c['message'] for c in storage.read_comments('erin', num)) \
+        == ['one', 'two']
+    entries = [{'description': str(n), 'timestamp': str(n)}
+               for n in range(5)]
+    for entry in entries:
+        storage.append_log('erin', num, entry)
+    assert storage.read_log('erin', num) == entries
+
+
+def check_tags(backend: str) -> None:
+    storage = make_storage(backend)
+    storage.write_tags(['x', 'y'])
+    assert storage.read_tags() == frozenset(['x', 'y'])
+    storage.write_tags([])
+    assert storage.read_tags() == frozenset()
+
+
+def check_reopen(backend: str) -> None:
+    storage = make_storage(backend)
+    num = storage.allocate_id('frank')
+    storage.write_issue('frank', num, issue_data('frank', num))
+    storage.add_comment('frank', num, comment_data('frank', num, 'hi'))
+    storage.close()
+    storage = make_storage(backend)
+    assert storage.read_issue('frank', num) == issue_data('frank', num)
+    assert storage.comment_count('frank', num) == 1
+    assert storage.allocate_id('frank') > num
+
+
+def check_parallel_load(backend: str) -> None:
+    from ishu.models import load_issues_from_files
+    storage = make_storage(backend)
+    for _ in range(20):
+        num = storage.allocate_id('grace')
+        storage.write_issue('grace', num, issue_data('grace', num))
+    storage.close()
+    serial = load_issues_from_files('grace')
+    parallel = load_issues_from_files('grace', workers=4, use_processes=True)
+    assert len(serial) == 20, len(serial)
+    assert parallel == serial
+    assert len(set(serial + parallel)) == 20
+
+
+CHECKS: List[Callable[[str], None]] = [
+    check_empty, check_allocate, check_issues, check_comments_and_log,
+    check_tags, check_reopen, check_parallel_load,
+]
+
+
+# == Benchmark ==
+
+def timed(func: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def benchmark(backend: str, count: int) -> Dict[str, float]:
+    storage = make_storage(backend)
+    nums: List[int] = []
+
+    def write() -> None:
+        for _ in range(count):
+            num = storage.allocate_id('bench')
+            storage.write_issue('bench', num, issue_data('bench', num))
+            nums.append(num)
+
+    def comment() -> None:
+        for num in nums:
+            storage.add_comment('bench', num,
+                                comment_data('bench', num, 'comment'))
+            storage.append_log('bench', num, {'description': 'old'})
+
+    def read_all() -> None:
+        for user, num in storage.issue_ids():
+            try:
+                storage.read_issue(user, num)
+            except FileNotFoundError:
+                # Allocated but never written
+                continue
+            storage.comment_count(user, num)
+
+    def read_full() -> None:
+        for num in nums[::10]:
+            storage.read_comments('bench', num)
+            storage.read_log('bench', num)
+
+    results = {'write': timed(write), 'comment': timed(comment)}
+    storage.close()
+    # Reading happens in a new process in real use
+    storage = make_storage(backend)
+    results['read all'] = timed(read_all)
+    results['read 10%'] = timed(read_full)
+    return results
+
+
+def run_backend(backend: str, count: int) -> None:
+    failed = False
+    for check in CHECKS:
+        try:
+            check(backend)
+        except AssertionError as e:
+            failed = True
+            print(f'{backend:<10}  FAILED {check.__name__}: {e}')
+    if failed:
+        sys.exit(1)
+    results = benchmark(backend, count)
+    print(f'{backend:<10}  ' + '  '.join(f'{t * 1e6 / count:>10.1f}'
+                                         for t in results.values()))
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        run_backend(sys.argv[2], int(sys.argv[3]))
+        return
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    backends = sys.argv[2:] or BACKENDS
+    print(f'{count} issues, microseconds per issue')
+    print(f'{"backend":<10}  {"write":>10}  {"comment":>10}  '
+          f'{"read all":>10}  {"read 10%":>10}')
+    failed = False
+    for backend in backends:
+        with tempfile.TemporaryDirectory() as root:
+            os.mkdir(os.path.join(root, '.ishu'))
+            env = root_env(Path(root))
+            result = subprocess.run([sys.executable, __file__, '--child',
+                                     backend, str(count)], env=env)
+            failed = failed or result.returncode != 0
+    if failed:
+        sys.exit('FAILED')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Run several processes against one ishu root at the same time.
+
+Every process opens new issues, comments on them, and adds a different
+tag to one shared issue over and over with ishu edit. Afterwards all
+issue IDs must be unique, and the shared issue must have every tag and
+one log entry per edit, since losing an edit means that another process
+saved it without seeing the change.
+
+With --pack, the issues are stored in pack files instead of directories.
+
+Usage: python benchmarks/stress_locking.py [--pack] [processes] [rounds]
+"""
+import contextlib
+from datetime import datetime, timezone
+import io
+import multiprocessing
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+from suite import root_env
+
+
+def worker(worker_num: int, rounds: int) -> None:
+    from ishu.commands import cmd_edit
+    from ishu.common import Config
+    from ishu.models import allocate_issue_id, Comment, Issue, IssueStatus
+    for n in range(rounds):
+        now = datetime.now(timezone.utc)
+        description = f'worker {worker_num} round {n}'
+        issue = Issue(id_=allocate_issue_id('stress'), created=now,
+                      updated=now, description=description, tags=set(),
+                      blocked_by=set(), comment_count=0,
+                      status=IssueStatus.OPEN)
+        issue.save()
+        Comment(issue_id=issue.id_, user='stress', created=now,
+                message=description).save()
+        with contextlib.redirect_stdout(io.StringIO()):
+            cmd_edit(Config('stress'), ['1', '-t', f'w{worker_num}-{n}'])
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    packed = '--pack' in args
+    if packed:
+        args.remove('--pack')
+    processes = int(args[0]) if len(args) > 0 else 8
+    rounds = int(args[1]) if len(args) > 1 else 50
+    with tempfile.TemporaryDirectory() as root:
+        os.environ.update(root_env(Path(root)))
+        os.mkdir(os.path.join(root, '.ishu'))
+        if packed:
+            os.mkdir(os.path.join(root, '.ishu', 'pack'))
+        from ishu.models import load_issues_from_files
+        # Creates the shared issue
+        worker(0, 1)
+        context = multiprocessing.get_context('spawn')
+        start = time.perf_counter()
+        jobs = [context.Process(target=worker, args=(n, rounds))
+                for n in range(1, processes + 1)]
+        for job in jobs:
+            job.start()
+        for job in jobs:
+            job.join()
+        elapsed = time.perf_counter() - start
+        if any(job.exitcode for job in jobs):
+            sys.exit('a worker process failed')
+        issues = load_issues_from_files()
+        expected = processes * rounds + 1
+        ids = {issue.id_ for issue in issues}
+        shared = next(i for i in issues if i.id_.num == 1)
+        shared_log = shared.load_log()
+        comments = sum(issue.comment_count for issue in issues)
+        print(f'{processes} processes x {rounds} rounds in {elapsed:.2f}s')
+        # Including the one from creating the shared issue
+        edits = processes * rounds + 1
+        print(f'issues: {len(ids)}/{expected}, comments: {comments}/'
+              f'{expected}, shared log entries: {len(shared_log)}/{edits}, '
+              f'shared tags: {len(shared.tags)}/{edits}')
+        if not (len(issues) == len(ids) == comments == expected
+                and len(shared_log) == len(shared.tags) == edits):
+            sys.exit('FAILED')
+        print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Time the main commands on generated trackers of different sizes.
+
+Every tracker is generated from a seed with the real Issue.save and
+Comment.save, so the files are exactly what ishu writes, and the same
+parameters always give the same issues. Each size is then timed in its
+own process. Commands that change things (open, tag -e) go last.
+
+The results are printed as a table, and written as JSON with --json so
+they can be compared with an earlier run (eg. from another commit) with
+--compare. Generating big trackers is slow, so --keep saves them in a
+directory to be reused by later runs with the same parameters.
+
+Usage: python benchmarks/suite.py [options] [size...]
+
+The sizes default to 1000, 10000 and 100000 issues.
+
+  --users N       number of users (default: 5)
+  --comments N    average comments per issue (default: 1)
+  --tags N        number of different tags (default: 30)
+  --blocked N     fraction of issues blocked by another (default: 0.1)
+  --log N         edits per issue, each adding a log entry (default: 1)
+  --seed N        random seed (default: 1)
+  --repeat N      runs per case, the best and median are kept (default: 3)
+  --backend B     directory, pack or sqlite (default: directory)
+  --keep DIR      keep generated trackers in DIR and reuse them
+  --json FILE     write the results to FILE
+  --compare FILE  compare with the results in FILE
+"""
+import contextlib
+from datetime import datetime, timedelta, timezone
+import io
+import itertools
+import json
+import os
+from pathlib import Path
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_PARAMS: Dict[str, Any] = {
+    'users': 5, 'comments': 1, 'tags': 30, 'blocked': 0.1, 'log': 1,
+    'seed': 1, 'backend': 'directory',
+}
+BENCH_USER = 'user0'
+# How often each IssueStatus is picked: most issues in an old tracker are
+# closed one way or another
+STATUS_WEIGHTS = [1, 3, 5, 1]
+PARAMS_FNAME = 'bench-params.json'
+
+
+# == Generating trackers ==
+
+def generate(count: int, params: Dict[str, Any]) -> None:
+    # Runs in a child process with ISHUROOT set to the new tracker
+    from ishu.models import (allocate_issue_id, batched_writes, Comment,
+                             Issue, IssueID, IssueStatus)
+    from ishu.storage import pack_issues
+    from ishu.tags import register_tags
+
+    rng = random.Random(f'{params["seed"]}-{count}')
+    users = [f'user{n}' for n in range(params['users'])]
+    tags = [f'tag{n}' for n in range(params['tags'])]
+    statuses = list(IssueStatus)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    ids: List[IssueID] = []
+    register_tags(tags)
+    with batched_writes():
+        for num in range(count):
+            user = rng.choice(users)
+            created = start + timedelta(minutes=num)
+            blocked_by = set()
+            if ids and rng.random() < params['blocked']:
+                blocked_by.add(rng.choice(ids))
+            issue = Issue(id_=allocate_issue_id(user), created=created,
+                          updated=created,
+                          description=f'Issue number {num} ' + ' '.join(
+                              rng.choice(WORDS)
+                              for _ in range(rng.randrange(3, 15))),
+                          tags=rng.sample(tags, min(len(tags),
+                                                    rng.randrange(4))),
+                          blocked_by=blocked_by, comment_count=0,
+                          status=IssueStatus.OPEN)
+            issue.save(user)
+            ids.append(issue.id_)
+            status = rng.choices(statuses, STATUS_WEIGHTS)[0]
+            for edit in range(params['log']):
+                issue = Issue.load_from_id(issue.id_)
+                if edit == params['log'] - 1:
+                    issue = issue._replace(status=status)
+                else:
+                    issue = issue._replace(
+                        description=f'{issue.description} (edit {edit})')
+                issue.save(rng.choice(users))
+            for n in range(_poisson(rng, params['comments'])):
+                Comment(issue_id=issue.id_, user=rng.choice(users),
+                        created=created + timedelta(seconds=n + 1),
+                        message=' '.join(rng.choice(WORDS)
+                                         for _ in range(rng.randrange(30)))
+                        ).save()
+    if params['backend'] != 'directory':
+        pack_issues(sqlite=params['backend'] == 'sqlite')
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    # Number of comments on an issue, with mean as the average
+    if mean <= 0:
+        return 0
+    count = 0
+    total = rng.expovariate(1)
+    while total < mean:
+        count += 1
+        total += rng.expovariate(1)
+    return count
+
+
+WORDS = ('crash bug fix add remove config list tag issue slow fast file '
+         'index search user comment open close block unicode ünïcödé '
+         'window terminal error warning docs test release').split()
+
+
+# == Timing ==
+
+def _quiet(func: Callable[[], Any]) -> Callable[[], Any]:
+    def wrapper() -> Any:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func()
+    return wrapper
+
+
+def run_cases(count: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    # Runs in a child process with ISHUROOT set to a copy of the tracker
+    from ishu import commands
+    from ishu.common import Config, INDEX_PATH
+    from ishu.models import load_issues
+
+    config = Config(BENCH_USER)
+
+    def cmd(func: Callable[[Config, List[str]], None],
+            *args: str) -> Callable[[], None]:
+        return _quiet(lambda: func(config, list(args)))
+
+    def cold_list() -> None:
+        if INDEX_PATH.exists():
+            INDEX_PATH.unlink()
+        commands.cmd_list(config, [])
+
+    # Rename it back and forth so every run does the same thing
+    renames = itertools.cycle([('tag1', 'renamed'), ('renamed', 'tag1')])
+
+    def tag_edit() -> None:
+        old, new = next(renames)
+        # Answer yes to renaming it in all issues
+        sys.stdin = io.StringIO('y\n')
+        try:
+            commands.cmd_tag(config, ['-e', old, new])
+        finally:
+            sys.stdin = sys.__stdin__
+
+    cases: Dict[str, Callable[[], Any]] = {
+        'list (no index)': _quiet(cold_list),
+        'load_issues': load_issues,
+        'list': cmd(commands.cmd_list),
+        'list -s open': cmd(commands.cmd_list, '-s', 'open'),
+        'list -s fixed': cmd(commands.cmd_list, '-s', 'fixed'),
+        'list -s closed': cmd(commands.cmd_list, '-s', 'closed'),
+        'list -t tag1': cmd(commands.cmd_list, '-t', 'tag1'),
+        'list -T tag1': cmd(commands.cmd_list, '-T', 'tag1'),
+        'list -B': cmd(commands.cmd_list, '-B'),
+        'list -b': cmd(commands.cmd_list, '-b'),
+        'list -n': cmd(commands.cmd_list, '-n'),
+        'list -l': cmd(commands.cmd_list, '-l'),
+        # The 20 most recently updated issues
+        'list top 20': cmd(commands.cmd_list, '-S', 'updated', '-r',
+                           '-N', '20'),
+        'list -s open top 20': cmd(commands.cmd_list, '-s', 'open',
+                                   '-S', 'updated', '-r', '-N', '20'),
+        'show': cmd(commands.cmd_info, '1'),
+        'tag -l': cmd(commands.cmd_tag, '-l'),
+        'tag -l -u': cmd(commands.cmd_tag, '-l', '-u'),
+        'open': cmd(commands.cmd_open, '-t', 'tag2', 'A new issue'),
+        'tag -e': _quiet(tag_edit),
+    }
+    results = {}
+    for name, func in cases.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        results[name] = {'min': min(times),
+                         'median': statistics.median(times)}
+    return results
+
+
+# == Running ==
+
+def root_env(root: Path, **env: str) -> Dict[str, str]:
+    """Return os.environ with ISHUROOT set to root, and env added."""
+    # The root is read when ishu is imported, so a process has to be
+    # given its root before that, usually by starting a new one
+    return dict(os.environ, ISHUROOT=str(root), **env)
+
+
+def _child(mode: str, root: Path, count: int,
+           params: Dict[str, Any]) -> Any:
+    env = root_env(root, HOME=str(root))
+    if mode == 'generate':
+        # Nothing is lost if this crashes
+        env['ISHU_DURABILITY'] = 'none'
+    result = subprocess.run(
+        [sys.executable, __file__, '--child', mode, str(count),
+         json.dumps(params)],
+        env=env, stdout=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        sys.exit(f'{mode} failed for {count} issues')
+    return json.loads(result.stdout) if result.stdout else None
+
+
+def tracker(keep: Optional[Path], tmp: Path, count: int,
+            params: Dict[str, Any]) -> Path:
+    """Return a generated tracker, reusing a kept one if possible."""
+    gen_params = {k: v for k, v in params.items() if k != 'repeat'}
+    base = keep if keep is not None else tmp
+    name = '-'.join(f'{v}' for v in gen_params.values())
+    root = base / f'{count}-{name}'
+    params_path = root / '.ishu' / PARAMS_FNAME
+    if params_path.exists() \
+            and json.loads(params_path.read_text()) == gen_params:
+        return root
+    if root.exists():
+        shutil.rmtree(root)
+    (root / '.ishu').mkdir(parents=True)
+    start = time.perf_counter()
+    _child('generate', root, count, gen_params)
+    print(f'Generated {count} issues in {time.perf_counter() - start:.1f}s',
+          file=sys.stderr)
+    params_path.write_text(json.dumps(gen_params))
+    return root
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).parent, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: Dict[str, Any],
+                  old: Optional[Dict[str, Any]]) -> None:
+    for size, cases in results['sizes'].items():
+        old_cases = (old or {}).get('sizes', {}).get(size, {})
+        print(f'\n{size} issues')
+        print(f'{"case":<20}  {"best (ms)":>10}  {"median (ms)":>11}'
+              + (f'  {"old best":>10}  {"change":>7}' if old else ''))
+        for name, r in cases.items():
+            line = (f'{name:<20}  {r["min"] * 1000:>10.1f}  '
+                    f'{r["median"] * 1000:>11.1f}')
+            if name in old_cases:
+                old_min = old_cases[name]['min']
+                line += (f'  {old_min * 1000:>10.1f}  '
+                         f'{r["min"] / old_min - 1:>+7.0%}')
+            print(line)
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    if args and args[0] == '--child':
+        mode, count, params = args[1], int(args[2]), json.loads(args[3])
+        if mode == 'generate':
+            generate(count, params)
+        else:
+            print(json.dumps(run_cases(count, params['repeat'])))
+        return
+    params = dict(DEFAULT_PARAMS, repeat=3)
+    keep: Optional[Path] = None
+    json_path: Optional[Path] = None
+    old: Optional[Dict[str, Any]] = None
+    sizes = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--keep':
+            keep = Path(args.pop(0)).resolve()
+        elif arg == '--json':
+            json_path = Path(args.pop(0))
+        elif arg == '--compare':
+            old = json.loads(Path(args.pop(0)).read_text())
+        elif arg == '--backend':
+            params['backend'] = args.pop(0)
+        elif arg.startswith('--') and arg[2:] in params:
+            params[arg[2:]] = type(params[arg[2:]])(args.pop(0))
+        else:
+            sizes.append(int(arg))
+    results: Dict[str, Any] = {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'params': params,
+        'sizes': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sizes or DEFAULT_SIZES:
+            root = tracker(keep, Path(tmp), count, params)
+            # Commands change the tracker, so time a copy of it
+            work = Path(tmp) / 'work'
+            if work.exists():
+                shutil.rmtree(work)
+            shutil.copytree(root, work, symlinks=True)
+            results['sizes'][str(count)] = _child('run', work, count, params)
+    print_results(results, old)
+    if json_path is not None:
+        json_path.write_text(json.dumps(results, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Compare parse_timestamp with the old strptime-based parsing.
+
+Usage: python benchmarks/timestamps.py [iterations]
+"""
+from datetime import datetime
+import sys
+import timeit
+
+from ishu.common import parse_timestamp, TIMESTAMP_FMT
+
+
+SAMPLES = [
+    '2019-03-02T12:34:56+0000',
+    '2021-11-30T23:59:59+0200',
+    '2018-06-15T08:00:00-0530',
+    # The old format
+    '2017-01-01T00:00:00Z',
+]
+
+
+def parse_timestamp_strptime(raw: str) -> datetime:
+    if raw.endswith('Z'):
+        raw = raw[:-1] + '+0000'
+    return datetime.strptime(raw, TIMESTAMP_FMT)
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for sample in SAMPLES:
+        assert parse_timestamp(sample) == parse_timestamp_strptime(sample)
+    print(f'{"parser":<10}  {"per call (us)":>14}')
+    for name, func in [('strptime', parse_timestamp_strptime),
+                       ('fast', parse_timestamp)]:
+        elapsed = timeit.timeit(lambda: [func(s) for s in SAMPLES],
+                                number=iterations)
+        per_call = elapsed / (iterations * len(SAMPLES)) * 1e6
+        print(f'{name:<10}  {per_call:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
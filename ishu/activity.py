@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+import json
+import os
+from pathlib import Path
+from typing import (Any, Dict, Iterable, Iterator, List, NamedTuple,
+                    Optional, Tuple)
+
+from .common import (ACTIVITY_PATH, append_text, parse_json_lines,
+                     parse_timestamp, TIMESTAMP_FMT)
+
+# Events are recorded after the issue is saved, so commands running at the
+# same time can append them this far out of order
+MAX_EVENT_SKEW = timedelta(minutes=1)
+
+
+class Event(NamedTuple):
+    timestamp: datetime
+    # Who did it, not necessarily the owner of the issue
+    user: Optional[str]
+    issue_id: Tuple[str, int]
+    # One of open, edit, status and comment
+    action: str
+    details: str
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any]) -> 'Event':
+        return cls(timestamp=parse_timestamp(data['timestamp']),
+                   user=data['user'],
+                   issue_id=(data['issue']['user'], data['issue']['id']),
+                   action=data['action'],
+                   details=data['details'])
+
+
+def record_event(timestamp: datetime, user: Optional[str],
+                 issue_id: Tuple[str, int], action: str,
+                 details: str) -> None:
+    if not ACTIVITY_PATH.parent.exists():
+        return
+    append_text(ACTIVITY_PATH, json.dumps({
+        'timestamp': timestamp.strftime(TIMESTAMP_FMT),
+        'user': user,
+        'issue': {'user': issue_id[0], 'id': issue_id[1]},
+        'action': action,
+        'details': details,
+    }) + '\n')
+
+
+def _reversed_lines(path: Path, block_size: int = 8192) -> Iterator[bytes]:
+    with path.open('rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        rest = b''
+        while pos > 0:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + rest).split(b'\n')
+            # The first line is probably not complete yet
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line
+        if rest:
+            yield rest
+
+
+def _parse_events(lines: Iterable[bytes]) -> Iterator[Event]:
+    for data in parse_json_lines(lines):
+        try:
+            yield Event.from_data(data)
+        except KeyError:
+            continue
+
+
+def recent_events(limit: Optional[int] = None,
+                  since: Optional[datetime] = None,
+                  user: Optional[str] = None) -> Iterator[Event]:
+    # The activity log is only ever appended to, so reading it backwards
+    # gives the newest events first without looking at the older ones
+    if limit is not None and limit <= 0:
+        return
+    try:
+        count = 0
+        for event in _parse_events(_reversed_lines(ACTIVITY_PATH)):
+            if since is not None and event.timestamp < since:
+                if event.timestamp < since - MAX_EVENT_SKEW:
+                    break
+                continue
+            if user is not None and event.user != user:
+                continue
+            yield event
+            count += 1
+            if limit is not None and count >= limit:
+                break
+    except FileNotFoundError:
+        return
+
+
+def events_since(pos: int) -> Tuple[List[Event], int]:
+    """
+    Return the events added after byte offset pos, oldest first, and the
+    offset to continue from next time.
+    """
+    try:
+        with ACTIVITY_PATH.open('rb') as f:
+            f.seek(pos)
+            data = f.read()
+    except FileNotFoundError:
+        return [], pos
+    # Leave a line that's still being written for next time
+    end = data.rfind(b'\n') + 1
+    return list(_parse_events(data[:end].splitlines())), pos + end
@@ -0,0 +1,83 @@
+"""
+Forwarding commands to a running ishu serve.
+
+This is imported before the command is, so it shouldn't import anything
+slow from ishu.
+"""
+import json
+import os
+import socket
+import sys
+from typing import Any, Dict, List, Optional
+
+from .common import SOCKET_PATH
+
+# Only commands that never ask for input can be forwarded
+FORWARDED_COMMANDS = frozenset([
+    'list', 'ls', 'show', 's', 'open', 'o', 'edit', 'e', 'comment', 'c',
+])
+# Environment variables that change what commands print, which are set
+# to the client's values (or unset) while the command runs on the server
+FORWARDED_ENV = ('COLUMNS', 'ISHU_NO_ICONS', 'TZ')
+
+
+def send_message(sock: socket.socket, data: Dict[str, Any]) -> None:
+    # One message each way per connection, so the end of a message is
+    # simply the end of the stream
+    sock.sendall(json.dumps(data).encode())
+    sock.shutdown(socket.SHUT_WR)
+
+
+def recv_message(sock: socket.socket) -> Dict[str, Any]:
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    data: Dict[str, Any] = json.loads(b''.join(chunks))
+    return data
+
+
+def _terminal_columns() -> Optional[int]:
+    try:
+        return os.get_terminal_size(sys.stdout.fileno()).columns
+    except (OSError, ValueError):
+        return None
+
+
+def _forwarded_env() -> Dict[str, Optional[str]]:
+    env = {name: os.environ.get(name) for name in FORWARDED_ENV}
+    if env['COLUMNS'] is None:
+        # The server can't see our terminal
+        columns = _terminal_columns()
+        env['COLUMNS'] = None if columns is None else str(columns)
+    return env
+
+
+def forward(args: List[str]) -> Optional[int]:
+    """
+    Run the command on the server for this root and return its exit
+    status, or None if it has to be run here instead.
+    """
+    if not args or args[0] not in FORWARDED_COMMANDS \
+            or not hasattr(socket, 'AF_UNIX') or not SOCKET_PATH.exists():
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(SOCKET_PATH))
+        except OSError:
+            # Left behind by a server that didn't shut down cleanly
+            return None
+        # The command may have been run already, so it's too late to
+        # fall back if anything goes wrong from here on
+        try:
+            send_message(sock, {'args': args, 'env': _forwarded_env()})
+            response = recv_message(sock)
+        except (OSError, ValueError) as e:
+            print(f'Lost connection to ishu serve: {e}', file=sys.stderr)
+            return 1
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    status: int = response['status']
+    return status
@@ -0,0 +1,982 @@
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from operator import itemgetter
+import os
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from dateutil.tz import gettz
+
+from libwui import cli
+from libwui.cli import CommandHelp, error, format_table, OptionHelp
+from libwui.colors import CYAN, GREEN, RED, RESET
+
+from .activity import recent_events
+from .common import Config, migration_running, TAG_MIGRATION_PATH
+from .index import IssueIndex
+from .models import (allocate_issue_id, Comment, Issue, IssueFilter, IssueID,
+                     IssueSort, IssueStatus, iter_issues,
+                     iter_issues_and_blockers, locked_issue, SORT_KEYS)
+from .storage import (DirectoryStorage, get_storage, pack_issues,
+                      unpack_issues)
+from .tags import (load_tag_registry, MigrationResult, register_tags,
+                   tag_usage, TagMigration)
+from . import trace
+
+
+# == Command parsing helpers ==
+
+def _arg_issue_id(args: List[str], config: Config,
+                  specify_id: bool = False,
+                  restrict_to_own: bool = False) -> IssueID:
+    try:
+        raw_issue_id = args.pop(0)
+    except IndexError:
+        error('issue ID required')
+    try:
+        issue_id = IssueID.load(config, raw_issue_id,
+                                restrict_to_own=restrict_to_own)
+    except Exception as e:
+        if specify_id:
+            error(f'failed to parse issue ID {raw_issue_id}: {e}')
+        else:
+            error(str(e))
+    return issue_id
+
+
+# == Commands ==
+
+
+help_info = CommandHelp(
+    description='show info about an issue',
+    usage='<id>',
+    options=[]
+)
+
+
+def cmd_info(config: Config, args: List[str]) -> None:
+    # Args
+    issue_id: IssueID
+    # Parse args
+    issue_id = _arg_issue_id(args, config)
+    cli.arg_disallow_trailing(args)
+    # Run command
+    issue = Issue.load_from_id(issue_id)
+    print(issue.info(config))
+
+
+help_open = CommandHelp(
+    description='open a new issue',
+    usage='[-t <tag>...] [-b <id>...] <description>',
+    options=[
+        OptionHelp(spec='-t/--tags <tag>...',
+                   description='add tags to the issue'),
+        OptionHelp(spec='-b/--blocked-by <id>...',
+                   description='mark the new issue as blocked by other issues')
+    ]
+)
+
+
+def cmd_open(config: Config, args: List[str]) -> None:
+    # Args
+    tags: Optional[Set[str]] = None
+    blocked_by: Optional[Set[IssueID]] = None
+    description: str
+
+    # Parse args
+    description = cli.arg_positional(args, 'description', position=-1)
+    while args:
+        arg = args.pop(0)
+        cli.arg_disallow_positional(arg)
+        if arg in {'-t', '--tags'}:
+            tags = cli.arg_tags(args, '--tags')
+        elif arg in {'-b', '--blocked-by'}:
+            blocked_by = set()
+            while args and not args[0].startswith('-'):
+                blocked_by.add(_arg_issue_id(args, config, specify_id=True))
+        else:
+            cli.arg_unknown_optional(arg)
+
+    # Run command
+    now = datetime.now(timezone.utc)
+    issue = Issue(id_=allocate_issue_id(config.user),
+                  created=now,
+                  updated=now,
+                  description=description,
+                  tags=(tags or set()),
+                  blocked_by=(blocked_by or set()),
+                  comment_count=0,
+                  status=IssueStatus.OPEN)
+    issue.save(config.user)
+    print(f'Issue #{issue.id_.num} opened')
+
+
+help_edit = CommandHelp(
+    description='edit an issue',
+    usage='<id> [-d <description>] [-t <tag>...] [-T <tag>...]',
+    options=[
+        OptionHelp(spec='-d/--description <description>',
+                   description='set the description'),
+        OptionHelp(spec='-t/--add-tags <tag>...',
+                   description='add tags to the issue'),
+        OptionHelp(spec='-T/--remove-tags <tag>...',
+                   description='remove tags from the issue')
+    ]
+)
+
+
+def cmd_edit(config: Config, args: List[str]) -> None:
+    # Args
+    issue_id: IssueID
+    description: Optional[str] = None
+    add_tags: Optional[Set[str]] = None
+    remove_tags: Optional[Set[str]] = None
+    # Parse args
+    issue_id = _arg_issue_id(args, config)
+    while args:
+        arg = args.pop(0)
+        if not arg.startswith('-'):
+            error(f'unknown positional argument: {arg}')
+        elif arg in {'-d', '--description'}:
+            try:
+                description = args.pop(0)
+            except IndexError:
+                error('no description provided')
+        elif arg in {'-t', '--add-tags'}:
+            add_tags = cli.arg_tags(args, '--add-tags')
+        elif arg in {'-T', '--remove-tags'}:
+            remove_tags = cli.arg_tags(args, '--remove-tags')
+        else:
+            error(f'unknown argument: {arg}')
+    # Run command
+    # Locked from loading to saving, so that nobody else's changes are
+    # lost in between
+    with locked_issue(issue_id):
+        issue = Issue.load_from_id(issue_id)
+        changed = False
+        if description and description != issue.description:
+            issue = issue._replace(description=description)
+            changed = True
+        if add_tags and not add_tags.issubset(issue.tags):
+            issue = issue._replace(tags=issue.tags | add_tags)
+            changed = True
+        if remove_tags and remove_tags.intersection(issue.tags):
+            issue = issue._replace(tags=issue.tags - remove_tags)
+            changed = True
+        if changed:
+            issue.save(config.user)
+            print('Issue edited')
+        else:
+            print('Nothing to update')
+
+
+def _change_status(user: str, issue_id: IssueID,
+                   target_status: IssueStatus,
+                   status_text: str, result_text: str,
+                   comment_text: Optional[str] = None) -> None:
+    with locked_issue(issue_id):
+        issue = Issue.load_from_id(issue_id)
+        if issue.status == target_status:
+            print(f'Issue is already {status_text}')
+        else:
+            issue._replace(status=target_status).save(user)
+            if comment_text:
+                Comment(issue_id=issue_id, user=user,
+                        created=datetime.now(timezone.utc),
+                        message=comment_text).save()
+            print(f'Issue {issue_id.num} {result_text}')
+
+
+help_reopen = CommandHelp(
+    description='reopen a closed issue',
+    usage='<id>',
+    options=[]
+)
+
+
+def cmd_reopen(config: Config, args: List[str]) -> None:
+    # Args
+    issue_id: IssueID
+    # Parse args
+    issue_id = _arg_issue_id(args, config)
+    # Run command
+    _change_status(config.user, issue_id, IssueStatus.OPEN,
+                   'open', 'reopened')
+
+
+help_fixed = CommandHelp(
+    description='close an issue and mark it as fixed',
+    usage='<id> [<comment>]',
+    options=[]
+)
+
+
+def cmd_fixed(config: Config, args: List[str]) -> None:
+    # Args
+    issue_id: IssueID
+    comment: Optional[str] = None
+    # Parse args
+    issue_id = _arg_issue_id(args, config)
+    if args:
+        comment = args.pop(0)
+    cli.arg_disallow_trailing(args)
+    # Run command
+    _change_status(config.user, issue_id, IssueStatus.FIXED,
+                   'marked as fixed', 'closed and marked as fixed',
+                   comment_text=comment)
+
+
+help_wontfix = CommandHelp(
+    description='close an issue and mark it as not going to be fixed',
+    usage='<id> [<comment>]',
+    options=[]
+)
+
+
+def cmd_wontfix(config: Config, args: List[str]) -> None:
+    # Args
+    issue_id: IssueID
+    comment: Optional[str] = None
+    # Parse args
+    issue_id = _arg_issue_id(args, config)
+    if args:
+        comment = args.pop(0)
+    cli.arg_disallow_trailing(args)
+    # Run command
+    _change_status(config.user, issue_id, IssueStatus.WONTFIX,
+                   'marked as wontfix', 'closed and marked as wontfix',
+                   comment_text=comment)
+
+
+help_blocked_by = CommandHelp(
+    description='mark an issue as being blocked '
+                'by another issue from completion',
+    usage='<blocked-id> <blocking-id>',
+    options=[]
+)
+
+
+def cmd_blocked_by(config: Config, args: List[str]) -> None:
+    # Args
+    blocked_id: IssueID
+    blocking_id: IssueID
+
+    # Parse args
+    blocked_id = _arg_issue_id(args, config, restrict_to_own=True)
+    blocking_id = _arg_issue_id(args, config)
+    cli.arg_disallow_trailing(args)
+    if blocked_id == blocking_id:
+        error("an issue can't block itself")
+
+    # Run command
+    s_blocked_id = f'#{blocked_id.shorten(config)}'
+    s_blocking_id = f'#{blocking_id.shorten(config)}'
+    # Only the issue being changed is locked, since only one issue lock
+    # can be held at a time
+    with locked_issue(blocked_id):
+        issue = Issue.load_from_id(blocked_id)
+        other_issue = Issue.load_from_id(blocking_id)
+        if blocking_id in issue.blocked_by:
+            print(f'Issue {s_blocked_id} is already blocked by '
+                  f'{s_blocking_id}, no changes were made.')
+        elif blocked_id in other_issue.blocked_by:
+            error(f'blocking loop detected! Issue {s_blocking_id} is '
+                  f'already blocked by {s_blocked_id}!')
+        else:
+            issue._replace(blocked_by=issue.blocked_by | {blocking_id}
+                           ).save(config.user)
+            print(f'Issue {s_blocked_id} marked as blocked by '
+                  f'{s_blocking_id}.')
+
+
+help_unblock = CommandHelp(
+    description='mark an issue as not being blocked '
+                'by another issue from completion',
+    usage='<blocked-id> <blocking-id>',
+    options=[]
+)
+
+
+def cmd_unblock(config: Config, args: List[str]) -> None:
+    # Args
+    blocked_id: IssueID
+    blocking_id: IssueID
+
+    # Parse args
+    blocked_id = _arg_issue_id(args, config, restrict_to_own=True)
+    blocking_id = _arg_issue_id(args, config)
+    cli.arg_disallow_trailing(args)
+    if blocked_id == blocking_id:
+        error("an issue can't block itself")
+
+    # Run command
+    s_blocked_id = f'#{blocked_id.shorten(config)}'
+    s_blocking_id = f'#{blocking_id.shorten(config)}'
+    with locked_issue(blocked_id):
+        issue = Issue.load_from_id(blocked_id)
+        if blocking_id not in issue.blocked_by:
+            print(f'Issue {s_blocked_id} is not blocked by '
+                  f'{s_blocking_id}, no changes were made.')
+        else:
+            issue._replace(blocked_by=issue.blocked_by - {blocking_id}
+                           ).save(config.user)
+            print(f'Issue #{blocked_id.shorten(config)} no longer marked '
+                  f'as blocked by #{blocking_id.shorten(config)}.')
+
+
+help_comment = CommandHelp(
+    description='add a comment to an issue',
+    usage='<id> <message>',
+    options=[]
+)
+
+
+def cmd_comment(config: Config, args: List[str]) -> None:
+    # Args
+    issue_id: IssueID
+    message: str
+
+    # Parse args
+    issue_id = _arg_issue_id(args, config)
+    message = cli.arg_positional(args, 'message')
+    cli.arg_disallow_trailing(args)
+
+    # Run command
+    comment = Comment(issue_id=issue_id,
+                      user=config.user,
+                      created=datetime.now(timezone.utc),
+                      message=message)
+    comment.save()
+    print('Comment added')
+
+
+help_list = CommandHelp(
+    description='list all issues or ones matching certain filters',
+    usage='[-s <status>] [-t <tag>...] [-T <tag>] [-S <key>] [-N <limit>] '
+          '[-O <offset>] [-BbnIDlr]',
+    options=[
+        OptionHelp(spec='-s/--status <status>',
+                   description='only show issues with this status'),
+        OptionHelp(
+            spec='',
+            description=f'(one of: {", ".join(s.value for s in IssueStatus)})'
+        ),
+        OptionHelp(spec='-t/--tags <tag>...',
+                   description='only show issues with these tags'),
+        OptionHelp(spec='-T/--without-tags <tag>...',
+                   description='only show issues without these tags'),
+        OptionHelp(spec='-B/--blocking',
+                   description='only show issues blocking another issue'),
+        OptionHelp(spec='-b/--blocked',
+                   description='only show issues blocked by other issues'),
+        OptionHelp(spec='-n/--no-blocks',
+                   description="don't show blocked or blocking issues"),
+        OptionHelp(spec='-I/--no-icons',
+                   description="don't show any special icons "
+                               "(also set with ISHU_NO_ICONS envvar)"),
+        OptionHelp(spec='-D/--no-dates',
+                   description="don't show the date columns"),
+        OptionHelp(spec='-l/--list-abc',
+                   description="list issues alphabetically "
+                               "(same as --sort description)"),
+        OptionHelp(spec='-S/--sort <key>',
+                   description='sort issues by this (default: id)'),
+        OptionHelp(spec='',
+                   description=f'(one of: {", ".join(SORT_KEYS)})'),
+        OptionHelp(spec='-r/--reverse',
+                   description='sort issues in reverse order'),
+        OptionHelp(spec='-N/--limit <limit>',
+                   description='show at most this many issues '
+                               '(default: 0, for no limit)'),
+        OptionHelp(spec='-O/--offset <offset>',
+                   description='skip this many issues first'),
+    ]
+)
+
+
+def cmd_list(config: Config, args: List[str]) -> None:
+    # Arguments
+    status: Optional[IssueStatus] = None
+    tags: Optional[Set[str]] = None
+    without_tags: Optional[Set[str]] = None
+    blocked = False
+    blocking = False
+    no_blocks = False
+    show_icons = not bool(os.environ.get('ISHU_NO_ICONS'))
+    show_dates = True
+    sort_key = 'id'
+    reverse = False
+    limit: Optional[int] = None
+    offset = 0
+
+    # Parse the arguments
+    while args:
+        arg = args.pop(0)
+        cli.arg_disallow_positional(arg)
+        if arg in {'-s', '--status'}:
+            try:
+                raw_status = args.pop(0)
+            except IndexError:
+                error('--status needs an argument')
+            else:
+                try:
+                    status = IssueStatus(raw_status)
+                except ValueError:
+                    error('invalid status: {raw_status}')
+        elif arg in {'-t', '--tags'}:
+            tags = cli.arg_tags(args, '--tags')
+        elif arg in {'-T', '--without-tags'}:
+            without_tags = cli.arg_tags(args, '--without-tags')
+        elif arg in {'-b', '--blocked'}:
+            blocked = True
+        elif arg in {'-B', '--blocking'}:
+            blocking = True
+        elif arg in {'-n', '--no-blocks'}:
+            no_blocks = True
+        elif arg in {'-I', '--no-icons'}:
+            show_icons = False
+        elif arg in {'-D', '--no-dates'}:
+            show_dates = False
+        elif arg in {'-l', '--list-abc'}:
+            sort_key = 'description'
+        elif arg in {'-S', '--sort'}:
+            try:
+                sort_key = args.pop(0)
+            except IndexError:
+                error('--sort needs an argument')
+            if sort_key not in SORT_KEYS:
+                error(f'invalid sort key: {sort_key}')
+        elif arg in {'-r', '--reverse'}:
+            reverse = True
+        elif arg in {'-N', '--limit'}:
+            try:
+                limit = int(args.pop(0)) or None
+            except IndexError:
+                error('--limit needs an argument')
+            except ValueError:
+                error('--limit needs a number')
+            if limit is not None and limit < 0:
+                error('--limit can\'t be negative')
+        elif arg in {'-O', '--offset'}:
+            try:
+                offset = int(args.pop(0))
+            except IndexError:
+                error('--offset needs an argument')
+            except ValueError:
+                error('--offset needs a number')
+            if offset < 0:
+                error('--offset can\'t be negative')
+        else:
+            cli.arg_unknown_optional(arg)
+    if no_blocks and (blocked or blocking):
+        error('--blocked or --blocking can\'t be used with --no-blocks')
+
+    # Run command
+    issue_filter = IssueFilter(status=status,
+                               tags=frozenset(tags or ()),
+                               without_tags=frozenset(without_tags or ()))
+    # Don't look at closed issues on disk unless they're being listed,
+    # and only look at the rest once for both the issues and the blocks
+    with trace.phase('find issues'):
+        sorted_issues, blockers = iter_issues_and_blockers(
+            issue_filter, IssueSort(sort_key, reverse))
+    is_blocking = set()
+
+    def matching_issues() -> Iterator[Issue]:
+        # Already sorted, so the rest aren't even loaded after the limit
+        for issue in sorted_issues:
+            # Only see issues as blocking if they are open
+            is_blocking_issue = (issue.status == IssueStatus.OPEN
+                                 and issue.id_ in blockers)
+            if is_blocking_issue:
+                is_blocking.add(issue.id_)
+            if blocking and not is_blocking_issue:
+                continue
+            if blocked and not issue.blocked_by:
+                continue
+            if no_blocks and (issue.blocked_by or is_blocking_issue):
+                continue
+            yield issue
+
+    with trace.phase('collect issues'):
+        issues = list(islice(matching_issues(), offset,
+                             None if limit is None else offset + limit))
+
+    date_fmt = '%Y-%m-%d'
+    time_fmt = '%H:%M'
+    datetime_fmt = f'{date_fmt} {time_fmt}'
+    one_day_ago = datetime.now(timezone.utc) - timedelta(days=1)
+
+    def _date_or_time_fmt(dt: datetime) -> str:
+        return dt.strftime(time_fmt if dt > one_day_ago else date_fmt)
+
+    status_icon = {
+        IssueStatus.FIXED: GREEN + ('' if show_icons else 'F'),
+        IssueStatus.OPEN: CYAN + ('' if show_icons else ' '),
+        IssueStatus.CLOSED: GREEN + ('' if show_icons else 'C'),
+        IssueStatus.WONTFIX: RED + ('' if show_icons else 'W'),
+    }
+
+    tz = gettz()
+
+    def cull_empty(items: Iterable[Optional[str]]) -> Iterable[str]:
+        for item in items:
+            if item is not None:
+                yield item
+
+    def generate_row(i: Issue, short: bool = False) -> Tuple[str, ...]:
+        status = status_icon[i.status] + RESET
+        blocks = (('b' if i.blocked_by else '')
+                  + ('B' if i.id_ in is_blocking else ''))
+        comments = str(i.comment_count)
+        tags = ', '.join(f'#{tag}' for tag in sorted(i.tags))
+        row: List[Optional[str]]
+        if short:
+            created = _date_or_time_fmt(i.created.astimezone(tz))
+            updated = (_date_or_time_fmt(i.updated.astimezone(tz))
+                       if i.updated > i.created else '')
+            row = [
+                i.id_.shorten(None),
+                status,
+                blocks,
+                created if show_dates else None,
+                updated if show_dates else None,
+                comments,
+                tags,
+                i.description,
+            ]
+        else:
+            created = i.created.astimezone(tz).strftime(datetime_fmt)
+            updated = (i.updated.astimezone(tz).strftime(datetime_fmt)
+                       if i.updated > i.created else '')
+            row = [
+                str(i.id_.num),
+                i.id_.user,
+                status,
+                blocks,
+                created if show_dates else None,
+                updated if show_dates else None,
+                comments,
+                tags,
+                i.description,
+            ]
+        return tuple(cull_empty(row))
+
+    titles = tuple(cull_empty([
+        'ID', 'User', 'S', (' ' if show_icons else 'Blocks'),
+        ('Created' if show_dates else None),
+        ('Updated' if show_dates else None),
+        (' ' if show_icons else 'Comments'),
+        'Tags', 'Description'
+    ]))
+
+    with trace.phase('format rows'):
+        table = [generate_row(i) for i in issues]
+    with trace.phase('render table'):
+        try:
+            for line in format_table(
+                    table, wrap_columns={-1, -2}, titles=titles,
+                    require_min_widths=frozenset({(-1, 30)})):
+                print(line)
+        except cli.TooNarrowColumn:
+            shorter_titles = tuple(cull_empty([
+                'ID', 'S', (' ' if show_icons else 'Blocks'),
+                ('Created' if show_dates else None),
+                ('Updated' if show_dates else None),
+                (' ' if show_icons else 'Cmnt'), 'Tags',
+                'Description'
+            ]))
+            shorter_table = [generate_row(i, short=True) for i in issues]
+            for line in format_table(shorter_table, wrap_columns={-1, -2},
+                                     titles=shorter_titles):
+                print(line)
+
+
+help_search = CommandHelp(
+    description='search for issues in descriptions and comments',
+    usage='<term>... [-s <status>] [-t <tag>...] [-T <tag>...]',
+    options=[
+        OptionHelp(spec='<term>',
+                   description='a word, a "quoted phrase", '
+                               'or a prefix ending with *'),
+        OptionHelp(spec='-s/--status <status>',
+                   description='only show issues with this status'),
+        OptionHelp(spec='-t/--tags <tag>...',
+                   description='only show issues with these tags'),
+        OptionHelp(spec='-T/--without-tags <tag>...',
+                   description='only show issues without these tags'),
+    ]
+)
+
+
+def cmd_search(config: Config, args: List[str]) -> None:
+    # Args
+    terms: List[str] = []
+    status: Optional[IssueStatus] = None
+    tags: Optional[Set[str]] = None
+    without_tags: Optional[Set[str]] = None
+    # Parse args
+    while args:
+        arg = args.pop(0)
+        if not arg.startswith('-'):
+            terms.append(arg)
+        elif arg in {'-s', '--status'}:
+            try:
+                raw_status = args.pop(0)
+            except IndexError:
+                error('--status needs an argument')
+            else:
+                try:
+                    status = IssueStatus(raw_status)
+                except ValueError:
+                    error(f'invalid status: {raw_status}')
+        elif arg in {'-t', '--tags'}:
+            tags = cli.arg_tags(args, '--tags')
+        elif arg in {'-T', '--without-tags'}:
+            without_tags = cli.arg_tags(args, '--without-tags')
+        else:
+            cli.arg_unknown_optional(arg)
+    if not any(term.rstrip('*') for term in terms):
+        error('no search terms given')
+    # Run command
+    issue_filter = IssueFilter(status=status,
+                               tags=frozenset(tags or ()),
+                               without_tags=frozenset(without_tags or ()),
+                               search_terms=tuple(terms))
+    table = [(i.id_.shorten(config), str(i.status), i.description)
+             for i in iter_issues(issue_filter)]
+    if not table:
+        print('No matching issues')
+        return
+    for line in format_table(table, wrap_columns={-1},
+                             titles=('ID', 'Status', 'Description')):
+        print(line)
+
+
+help_log = CommandHelp(
+    description='show a log of the latest actions (open/close/etc)',
+    usage='[-s <date>] [-u <user>] [-n <limit>]',
+    options=[
+        OptionHelp(spec='-s/--since <date>',
+                   description='only show actions since this date '
+                               '(YYYY-MM-DD or "YYYY-MM-DD HH:MM")'),
+        OptionHelp(spec='-u/--user <user>',
+                   description='only show actions by this user'),
+        OptionHelp(spec='-n/--limit <limit>',
+                   description='show at most this many actions '
+                               '(default: 20, 0 for no limit)'),
+    ]
+)
+
+
+def cmd_log(config: Config, args: List[str]) -> None:
+    # Args
+    since: Optional[datetime] = None
+    user: Optional[str] = None
+    limit: Optional[int] = 20
+    # Parse args
+    while args:
+        arg = args.pop(0)
+        cli.arg_disallow_positional(arg)
+        if arg in {'-s', '--since'}:
+            try:
+                raw_since = args.pop(0)
+            except IndexError:
+                error('--since needs an argument')
+            for fmt in ['%Y-%m-%d', '%Y-%m-%d %H:%M']:
+                try:
+                    since = datetime.strptime(raw_since, fmt)
+                except ValueError:
+                    continue
+                else:
+                    since = since.replace(tzinfo=gettz())
+                    break
+            else:
+                error(f'invalid date: {raw_since}')
+        elif arg in {'-u', '--user'}:
+            try:
+                user = args.pop(0)
+            except IndexError:
+                error('--user needs an argument')
+        elif arg in {'-n', '--limit'}:
+            try:
+                limit = int(args.pop(0)) or None
+            except IndexError:
+                error('--limit needs an argument')
+            except ValueError:
+                error('--limit needs a number')
+        else:
+            cli.arg_unknown_optional(arg)
+    # Run command
+    tz = gettz()
+    table = [(event.timestamp.astimezone(tz).strftime('%Y-%m-%d %H:%M'),
+              event.user or '',
+              IssueID(*event.issue_id).shorten(config),
+              event.action,
+              event.details)
+             for event in recent_events(limit=limit, since=since, user=user)]
+    if not table:
+        print('No actions found')
+        return
+    for line in format_table(table, wrap_columns={-1},
+                             titles=('Time', 'User', 'ID', 'Action',
+                                     'Details')):
+        print(line)
+
+
+help_tag = CommandHelp(
+    description='handle registered tags in this ishu project',
+    usage='(-l [-u]| -a <tag>... | -r <tag>... | -e <oldtag> <newtag> '
+          '| --resume)',
+    options=[
+        OptionHelp(spec='-l/--list',
+                   description='list registered tags'),
+        OptionHelp(spec='-u/--usage',
+                   description='sort tag list by usage'),
+        OptionHelp(spec='-a/--add <tag>...',
+                   description='register new tags'),
+        OptionHelp(spec='-r/--remove <tag>...',
+                   description='unregister and remove tags from all issues'),
+        OptionHelp(spec='-e/--edit <oldtag> <newtag>',
+                   description='rename a tag both in the registry '
+                               'and in all issues using it'),
+        OptionHelp(spec='--resume',
+                   description='finish an interrupted tag removal or rename'),
+    ]
+)
+
+
+def _print_migration_result(result: MigrationResult) -> None:
+    print(f'({result.modified} issues rewritten in {result.elapsed:.2f}s, '
+          f'{result.rate:.0f} issues/s)')
+
+
+def cmd_tag(config: Config, args: List[str]) -> None:
+    # Args
+    resume = False
+    list_tags = False
+    sort_by_usage = False
+    add_tags: Optional[Set[str]] = None
+    remove_tags: Optional[Set[str]] = None
+    edit_tag: Optional[Tuple[str, str]] = None
+
+    # Parse args
+    if not args:
+        list_tags = True
+    else:
+        arg = args.pop(0)
+        cli.arg_disallow_positional(arg)
+        if arg == '-lu':
+            list_tags = True
+            sort_by_usage = True
+        elif arg in {'-l', '--list'}:
+            list_tags = True
+            if args and args[0] in {'-u', '--usage'}:
+                args.pop(0)
+                sort_by_usage = True
+        elif arg in {'-a', '--add'}:
+            add_tags = cli.arg_tags(args, '--add')
+        elif arg in {'-r', '--remove'}:
+            remove_tags = cli.arg_tags(args, '--remove')
+        elif arg in {'-e', '--edit'}:
+            edit_tag = (cli.arg_positional(args, 'old tag'),
+                        cli.arg_positional(args, 'new tag'))
+        elif arg == '--resume':
+            resume = True
+        else:
+            cli.arg_unknown_optional(arg)
+    cli.arg_disallow_trailing(args)
+
+    # Run command
+    if migration_running():
+        # Listing is fine, it just might show some issues migrated already
+        if not list_tags:
+            error('a tag migration is in progress, '
+                  'try again once it has finished')
+    elif resume:
+        migration = TagMigration.load()
+        if migration is None:
+            error('no interrupted tag migration to resume')
+        print(f'Resuming tag migration of {len(migration.pending)} issues.')
+        _print_migration_result(migration.run(config.user))
+        return
+    elif TAG_MIGRATION_PATH.exists() and not list_tags:
+        error('an interrupted tag migration was found, '
+              'finish it first with --resume')
+    with trace.phase('load tag registry'):
+        tag_registry = load_tag_registry()
+    if list_tags:
+        with trace.phase('count tag usage'):
+            issue_tags = tag_usage()
+        issue_tags.update({t: 0 for t in tag_registry if t not in issue_tags})
+        tag_list = [(name, str(count))
+                    for name, count in sorted(sorted(issue_tags.most_common()),
+                                              key=itemgetter(1), reverse=True)]
+        if not sort_by_usage:
+            tag_list.sort()
+        unregistered_lines = {n: (RED, RESET)
+                              for n, (name, _) in enumerate(tag_list)
+                              if name not in tag_registry}
+        if tag_list:
+            with trace.phase('render table'):
+                print('\n'.join(format_table(
+                    tag_list, titles=('Tag name', 'Use count'),
+                    surround_rows=unregistered_lines)))
+        unregistered_tags = set(issue_tags.keys()) - tag_registry
+        if unregistered_tags:
+            print(f'\n{RED}{len(unregistered_tags)} '
+                  f'unregistered tags!{RESET}')
+    elif add_tags:
+        existing_tags = add_tags.intersection(tag_registry)
+        new_tags = add_tags - tag_registry
+        if existing_tags:
+            print('Existing tags that weren\'t added:',
+                  ', '.join(sorted(existing_tags)))
+        if new_tags:
+            print('Added tags:', ', '.join(sorted(new_tags)))
+            register_tags(new_tags)
+    elif remove_tags:
+        matched_tags = remove_tags.intersection(tag_registry)
+        unknown_tags = remove_tags - tag_registry
+        # TODO: remove/add unregistered tags?
+        if unknown_tags:
+            print('Unknown tags that weren\'t removed:',
+                  ', '.join(sorted(unknown_tags)))
+        if matched_tags:
+            print('Tags to remove:', ', '.join(sorted(matched_tags)))
+            with trace.phase('count tag usage'):
+                usage = tag_usage()
+            for tag in matched_tags:
+                if usage[tag]:
+                    response = input(f'Tag {tag!r} is used in '
+                                     f'{usage[tag]} issues. '
+                                     f'Remove it from all of them? [y/N] ')
+                    if response.lower() not in {'y', 'yes'}:
+                        print('Aborted tag removal, nothing was changed.')
+                        break
+            else:
+                with trace.phase('plan migration'):
+                    migration = TagMigration.plan(removals=matched_tags)
+                with trace.phase('run migration'):
+                    result = migration.run(config.user)
+                print(f'Tags removed, {result.modified} issues '
+                      f'were modified.')
+                _print_migration_result(result)
+    elif edit_tag:
+        old_name, new_name = edit_tag
+        if old_name == new_name:
+            error('old name and new name are identical')
+        if old_name not in tag_registry:
+            error(f'unknown tag: {old_name}')
+        if new_name in tag_registry:
+            error(f'new tag already exist: {new_name}')
+        with trace.phase('count tag usage'):
+            use_count = tag_usage()[old_name]
+        if use_count:
+            response = input(f'Tag {old_name!r} is used in '
+                             f'{use_count} issues. '
+                             f'Rename it to {new_name!r} '
+                             f'in all of them? [y/N] ')
+            if response.lower() not in {'y', 'yes'}:
+                print('Aborted tag edit, nothing was changed.')
+                return
+        with trace.phase('plan migration'):
+            migration = TagMigration.plan(renames={old_name: new_name})
+        with trace.phase('run migration'):
+            result = migration.run(config.user)
+        print(f'Tag {old_name!r} renamed to {new_name!r}.')
+        if result.modified:
+            print(f'{result.modified} issues were modified.')
+            _print_migration_result(result)
+
+
+help_reindex = CommandHelp(
+    description='rebuild the issue index from scratch',
+    usage='[-j <workers>] [-p]',
+    options=[
+        OptionHelp(spec='-j/--jobs <workers>',
+                   description='read issues with this many workers '
+                               '(default: number of CPUs)'),
+        OptionHelp(spec='-p/--processes',
+                   description='parse issues in processes '
+                               'instead of threads'),
+    ]
+)
+
+
+def cmd_reindex(config: Config, args: List[str]) -> None:
+    # Args
+    workers = os.cpu_count() or 1
+    use_processes = False
+    # Parse args
+    while args:
+        arg = args.pop(0)
+        cli.arg_disallow_positional(arg)
+        if arg in {'-j', '--jobs'}:
+            try:
+                workers = int(args.pop(0))
+            except IndexError:
+                error('--jobs needs an argument')
+            except ValueError:
+                error('--jobs needs a number')
+        elif arg in {'-p', '--processes'}:
+            use_processes = True
+        else:
+            cli.arg_unknown_optional(arg)
+    # Run command
+    if not isinstance(get_storage(), DirectoryStorage):
+        error('packed issues don\'t use the index')
+    with IssueIndex() as index:
+        count = index.rebuild(workers, use_processes)
+    print(f'Index rebuilt, {count} issues indexed')
+
+
+help_pack = CommandHelp(
+    description='store all issues in a few pack files instead of '
+                'one directory per issue (nobody else should be '
+                'using ishu at the same time)',
+    usage='[--sqlite]',
+    options=[
+        OptionHelp(spec='--sqlite',
+                   description='store everything in an sqlite database '
+                               'instead of pack files'),
+    ]
+)
+
+
+def cmd_pack(config: Config, args: List[str]) -> None:
+    # Args
+    sqlite = False
+    # Parse args
+    while args:
+        arg = args.pop(0)
+        cli.arg_disallow_positional(arg)
+        if arg == '--sqlite':
+            sqlite = True
+        else:
+            cli.arg_unknown_optional(arg)
+    # Run command
+    try:
+        count = pack_issues(sqlite)
+    except FileExistsError:
+        error('issues are already packed')
+    print(f'{count} issues packed')
+
+
+help_unpack = CommandHelp(
+    description='move all packed issues (or issues in sqlite) back into '
+                'one directory per issue (nobody else should be using '
+                'ishu at the same time)',
+    usage='',
+    options=[]
+)
+
+
+def cmd_unpack(config: Config, args: List[str]) -> None:
+    # Parse args
+    cli.arg_disallow_trailing(args)
+    # Run command
+    try:
+        count = unpack_issues()
+    except FileNotFoundError:
+        error('issues are not packed')
+    print(f'{count} issues unpacked')
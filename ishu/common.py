@@ -1,8 +1,24 @@
+import contextlib
+from datetime import datetime, timezone, tzinfo
+import enum
 import json
 import os
 from pathlib import Path
 import re
-from typing import Any, Dict, Iterable, Sized, Tuple
+import tempfile
+import threading
+from typing import (Any, Callable, ContextManager, Dict, IO, Iterable,
+                    Iterator, List, Optional, Sequence, Set, Sized, Tuple,
+                    TypeVar, Union)
+import zlib
+
+from . import trace
+
+try:
+    import fcntl
+except ImportError:
+    # No locking on Windows
+    fcntl = None  # type: ignore
 
 
 def _get_root() -> Tuple[bool, Path]:
@@ -18,7 +34,21 @@ ROOT_OVERRIDE, ROOT = _get_root()
 
 # Don't call this 'tags' to avoid conflicts with ctags
 TAGS_PATH = ROOT / 'registered_tags'
+LOCKS_PATH = ROOT / 'locks'
+# Append-only log of everything that happens to all issues
+ACTIVITY_PATH = ROOT / 'activity'
+# Only exists while a tag rename/removal is in progress
+TAG_MIGRATION_PATH = ROOT / 'tag-migration'
+# Derived data only, can always be rebuilt from the issue files
+INDEX_PATH = ROOT / 'index.db'
+# Only exists when the issues are stored in pack files
+PACK_PATH = ROOT / 'pack'
+# Only exists when the issues are stored in sqlite
+SQLITE_PATH = ROOT / 'issues.db'
+# Only exists while ishu serve is running
+SOCKET_PATH = ROOT / 'ishu.sock'
 ISSUE_FNAME = 'issue'
+LOG_FNAME = 'log'
 TIMESTAMP_FMT = '%Y-%m-%dT%H:%M:%S%z'
 CONFIG_PATH = Path.home() / '.config' / 'ishu.conf'
 
@@ -33,18 +63,368 @@ def user_paths() -> Iterable[Path]:
     return ROOT.glob('user-*')
 
 
+def issue_dirs(userdir: Path) -> List[Path]:
+    try:
+        with os.scandir(userdir) as entries:
+            return [Path(entry.path) for entry in entries
+                    if entry.name.startswith('issue-') and entry.is_dir()]
+    except FileNotFoundError:
+        return []
+
+
 def usernames() -> Iterable[str]:
     return [f.name.split('-', 1)[1] for f in user_paths()]
 
 
+class UserRegistry:
+    def __init__(self, users: Iterable[str]) -> None:
+        self.users = frozenset(users)
+        self._matches: Dict[str, List[str]] = {}
+        for user in sorted(self.users):
+            for i in range(1, len(user) + 1):
+                self._matches.setdefault(user[:i], []).append(user)
+        self._prefixes = {user: self._shortest_prefix(user)
+                          for user in self.users}
+
+    def _shortest_prefix(self, user: str) -> str:
+        for i in range(1, len(user) - 1):
+            prefix = user[:i]
+            if len(self._matches.get(prefix, [])) == 1:
+                return prefix
+        return user
+
+    def matches(self, prefix: str) -> List[str]:
+        return self._matches.get(prefix, [])
+
+    def shorten(self, user: str) -> str:
+        prefix = self._prefixes.get(user)
+        if prefix is None:
+            prefix = self._shortest_prefix(user)
+        return prefix
+
+
+def next_id_path(user: str) -> Path:
+    return user_path(user) / 'next-id'
+
+
 def issue_path(user: str, id_: int) -> Path:
     return user_path(user) / f'issue-{id_}' / ISSUE_FNAME
 
 
+def log_path(user: str, id_: int) -> Path:
+    return issue_path(user, id_).parent / LOG_FNAME
+
+
 def comment_paths(user: str, id_: int) -> Iterable[Path]:
     return issue_path(user, id_).parent.glob('comment-*')
 
 
+def read_json(path: Path) -> Any:
+    data = path.read_bytes()
+    trace.count('files read')
+    trace.count('bytes read', len(data))
+    return json.loads(data)
+
+
+def parse_json_lines(lines: Iterable[Union[str, bytes]]) -> Iterator[Any]:
+    # For files written with append_text, skipping lines that are broken
+    for line in lines:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Most likely a line that was cut off by a crash
+            continue
+
+
+def count_comments(issue_dir: Path) -> int:
+    trace.count('directories listed')
+    with os.scandir(issue_dir) as entries:
+        return sum(1 for entry in entries
+                   if entry.name.startswith('comment-'))
+
+
+# == Writing files ==
+
+@enum.unique
+class Durability(enum.Enum):
+    # fsync every file, even in batches
+    FILE = 'file'
+    # fsync every file, but in a batch only sync the directories (and
+    # appended files) once at the end
+    BATCH = 'batch'
+    # Never fsync, eg. for bulk imports
+    NONE = 'none'
+
+
+def _get_durability() -> Durability:
+    try:
+        return Durability(os.environ.get('ISHU_DURABILITY', 'batch'))
+    except ValueError:
+        return Durability.BATCH
+
+
+DURABILITY = _get_durability()
+
+# Appended files and directories with replaced files, inside write_batch(),
+# waiting to be synced
+_unsynced_paths: Optional[Set[Path]] = None
+
+# mkstemp makes files only the owner can read, but everything else
+# follows the umask, and other users of a shared root have to be able
+# to read what we write. The umask can only be read by changing it.
+_umask = os.umask(0o022)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def _fsync_path(path: Path) -> None:
+    # Works for both files and directories
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _sync_batch(paths: Set[Path]) -> None:
+    # Only what was written, not every filesystem like os.sync(), and
+    # each directory once however many files were replaced in it
+    for path in paths:
+        try:
+            _fsync_path(path)
+        except FileNotFoundError:
+            # Removed again later in the batch
+            continue
+
+
+@contextlib.contextmanager
+def write_batch() -> Iterator[None]:
+    # Files are still written and synced before being replaced one by
+    # one inside a batch, so a crash never leaves a half-written file,
+    # but with the batch durability the renames (and appends) are only
+    # synced to disk at the end
+    global _unsynced_paths
+    if _unsynced_paths is not None or DURABILITY != Durability.BATCH:
+        yield
+        return
+    _unsynced_paths = set()
+    try:
+        yield
+    finally:
+        paths, _unsynced_paths = _unsynced_paths, None
+        _sync_batch(paths)
+
+
+def flush_batch() -> None:
+    """Sync everything written so far in the current batch, if any."""
+    if _unsynced_paths:
+        _sync_batch(_unsynced_paths)
+        _unsynced_paths.clear()
+
+
+def atomic_write_text(path: Path, text: str, exclusive: bool = False) -> None:
+    # Write to a temporary file first so that nobody (including us after
+    # a crash) ever sees a half-written file. If exclusive is True, fail
+    # with FileExistsError instead of replacing an existing file.
+    # The data always has to be on disk before the rename is, or a crash
+    # could leave an empty file behind, but the rename can wait
+    sync_file = DURABILITY != Durability.NONE
+    sync_dir = (DURABILITY == Durability.FILE
+                or (DURABILITY == Durability.BATCH
+                    and _unsynced_paths is None))
+    trace.count('files written')
+    trace.count('bytes written', len(text))
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        if hasattr(os, 'fchmod'):
+            os.fchmod(fd, FILE_MODE)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            if sync_file:
+                f.flush()
+                os.fsync(f.fileno())
+        if exclusive:
+            os.link(tmp_name, path)
+            os.unlink(tmp_name)
+        else:
+            os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    if sync_dir:
+        _fsync_path(path.parent)
+    elif _unsynced_paths is not None:
+        _unsynced_paths.add(path.parent)
+
+
+def append_text(path: Path, text: str) -> None:
+    # Only for append-only files, where a partly written last line
+    # can be ignored when reading
+    created = not path.exists()
+    with path.open('a') as f:
+        f.write(text)
+        if DURABILITY == Durability.FILE \
+                or (DURABILITY == Durability.BATCH
+                    and _unsynced_paths is None):
+            f.flush()
+            os.fsync(f.fileno())
+            if created:
+                _fsync_path(path.parent)
+        elif _unsynced_paths is not None:
+            _unsynced_paths.add(path)
+            if created:
+                _unsynced_paths.add(path.parent)
+
+
+# == Locking ==
+
+# Open lock files and how many times they've been entered, so that the
+# same process can take a lock it's already holding
+_held_locks: Dict[str, Tuple[IO[str], int]] = {}
+_held_locks_mutex = threading.Lock()
+
+
+@contextlib.contextmanager
+def file_lock(name: str) -> Iterator[None]:
+    # Readers never need a lock since every file is replaced atomically,
+    # these are only for serializing read-modify-write cycles
+    if fcntl is None:
+        yield
+        return
+    with _held_locks_mutex:
+        held = _held_locks.get(name)
+        if held is not None:
+            _held_locks[name] = (held[0], held[1] + 1)
+    if held is None:
+        LOCKS_PATH.mkdir(exist_ok=True)
+        lock_file: IO[str] = (LOCKS_PATH / name).open('a')
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        with _held_locks_mutex:
+            _held_locks[name] = (lock_file, 1)
+    try:
+        yield
+    finally:
+        with _held_locks_mutex:
+            lock_file, count = _held_locks.pop(name)
+            if count > 1:
+                _held_locks[name] = (lock_file, count - 1)
+        if count == 1:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+
+
+def lock_is_held(name: str) -> bool:
+    """Return whether another process is holding a file_lock right now."""
+    if fcntl is None:
+        return False
+    with _held_locks_mutex:
+        if name in _held_locks:
+            return False
+    try:
+        lock_file = (LOCKS_PATH / name).open('a')
+    except FileNotFoundError:
+        # Nobody has ever taken a lock here
+        return False
+    with lock_file:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    return False
+
+
+# Issues share a fixed number of lock files, so that there aren't as many
+# lock files as there are issues
+ISSUE_LOCK_STRIPES = 256
+
+
+def issue_lock(user: str, id_: int) -> ContextManager[None]:
+    # Only one issue lock is ever held at a time, so two issues sharing
+    # a lock file can't cause a deadlock
+    stripe = zlib.crc32(f'{user}-{id_}'.encode()) % ISSUE_LOCK_STRIPES
+    return file_lock(f'issue-{stripe}')
+
+
+def root_lock() -> ContextManager[None]:
+    # Used for allocating IDs and editing the tag registry
+    return file_lock('root')
+
+
+MIGRATION_LOCK = 'tag-migration'
+
+
+def migration_lock() -> ContextManager[None]:
+    # Held for the whole of a tag migration, which can take a while, so
+    # that only one runs at a time without holding up everything else
+    return file_lock(MIGRATION_LOCK)
+
+
+def migration_running() -> bool:
+    return lock_is_held(MIGRATION_LOCK)
+
+
+# == Timestamps ==
+
+_timezones: Dict[str, tzinfo] = {'Z': timezone.utc}
+
+
+def _parse_timestamp_slow(raw: str) -> datetime:
+    # The old date doesn't play nice with strptime so convert it
+    # to the new one when needed
+    if raw.endswith('Z'):
+        raw = raw[:-1] + '+0000'
+    return datetime.strptime(raw, TIMESTAMP_FMT)
+
+
+def parse_timestamp(raw: str) -> datetime:
+    # strptime is slow, so read the fixed-width fields directly and only
+    # fall back to it for anything that doesn't look like TIMESTAMP_FMT
+    # (or the old format ending with Z)
+    if len(raw) < 20 or raw[4] != '-' or raw[10] != 'T' or raw[16] != ':':
+        return _parse_timestamp_slow(raw)
+    raw_tz = raw[19:]
+    tz = _timezones.get(raw_tz)
+    if tz is None:
+        # Let strptime validate every new timezone before it's cached
+        parsed = _parse_timestamp_slow(raw)
+        if parsed.tzinfo is not None:
+            _timezones[raw_tz] = parsed.tzinfo
+        return parsed
+    try:
+        return datetime(int(raw[0:4]), int(raw[5:7]), int(raw[8:10]),
+                        int(raw[11:13]), int(raw[14:16]), int(raw[17:19]),
+                        tzinfo=tz)
+    except ValueError:
+        return _parse_timestamp_slow(raw)
+
+
+# == Parallelism ==
+
+T = TypeVar('T')
+U = TypeVar('U')
+
+
+def parallel_map(func: Callable[[T], U], items: Sequence[T], workers: int,
+                 use_processes: bool = False) -> List[U]:
+    # Threads are best when waiting on the filesystem (eg. NFS), while
+    # processes are needed to actually parse things in parallel
+    if workers <= 1 or len(items) < 2:
+        return list(map(func, items))
+    # This takes a while to import, and usually isn't needed
+    from concurrent.futures import (Executor, ProcessPoolExecutor,
+                                    ThreadPoolExecutor)
+    executor: Executor
+    if use_processes:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    with executor:
+        chunksize = max(1, len(items) // (workers * 4))
+        return list(executor.map(func, items, chunksize=chunksize))
+
+
 # == Config ==
 
 class IncompleteConfigException(Exception):
@@ -93,4 +473,4 @@ class Config:
             'user': self.user,
             'aliases': self.aliases,
         }
-        CONFIG_PATH.write_text(json.dumps(data, indent=2))
+        atomic_write_text(CONFIG_PATH, json.dumps(data, indent=2))
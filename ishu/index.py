@@ -0,0 +1,380 @@
+from collections import Counter
+from itertools import chain
+import json
+from pathlib import Path
+import sqlite3
+from typing import (Any, Collection, Dict, Iterable, Iterator, List,
+                    Optional, Set, Tuple)
+
+from .common import (INDEX_PATH, issue_dirs, ISSUE_FNAME, parallel_map,
+                     parse_timestamp, read_json, ROOT, user_paths)
+from . import trace
+
+
+# Bump this whenever the schema changes, old indexes are then rebuilt
+SCHEMA_VERSION = 9
+
+SCHEMA = '''
+CREATE TABLE issues (
+    path TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    status TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    dir_mtime INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    comment_count INTEGER NOT NULL,
+    -- Copied out of data to sort by
+    num INTEGER NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX issues_user ON issues (user, num);
+CREATE INDEX issues_status ON issues (status);
+CREATE INDEX issues_by_id ON issues (num, user);
+CREATE INDEX issues_by_created ON issues (created, num, user);
+CREATE INDEX issues_by_updated ON issues (updated, num, user);
+CREATE INDEX issues_by_comments ON issues (comment_count, num, user);
+CREATE INDEX issues_by_description ON issues (description, num, user);
+CREATE TABLE blocks (
+    path TEXT NOT NULL,
+    user TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    blocker_user TEXT NOT NULL,
+    blocker_num INTEGER NOT NULL
+);
+CREATE INDEX blocks_path ON blocks (path);
+CREATE INDEX blocks_blocker ON blocks (blocker_user, blocker_num);
+CREATE TABLE tags (
+    tag TEXT NOT NULL,
+    path TEXT NOT NULL,
+    user TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    PRIMARY KEY (tag, path)
+) WITHOUT ROWID;
+CREATE INDEX tags_path ON tags (path);
+CREATE TABLE search_docs (
+    docid INTEGER PRIMARY KEY,
+    path TEXT NOT NULL
+);
+CREATE INDEX search_docs_path ON search_docs (path);
+'''
+
+# Not every sqlite has full-text search, so it's created separately
+SEARCH_SCHEMA = '''
+CREATE VIRTUAL TABLE search USING fts5(text, prefix='2 3');
+'''
+
+# What entries() can sort by, and the column for each
+SORT_COLUMNS = {
+    'id': 'num',
+    'created': 'created',
+    'updated': 'updated',
+    'comments': 'comment_count',
+    'description': 'description',
+}
+
+Signature = Tuple[int, int, int]
+IndexEntry = Tuple[Dict[str, Any], int]
+# The data in an issue file and the messages of all its comments
+IssueContent = Tuple[Dict[str, Any], List[str]]
+
+
+def _signature(issue_dir: Path) -> Signature:
+    dir_stat = issue_dir.stat()
+    file_stat = (issue_dir / ISSUE_FNAME).stat()
+    return (file_stat.st_mtime_ns, file_stat.st_size, dir_stat.st_mtime_ns)
+
+
+def _signature_or_none(issue_dir: Path) -> Optional[Signature]:
+    try:
+        return _signature(issue_dir)
+    except FileNotFoundError:
+        return None
+
+
+def _read_issue(issue_dir: Path) -> IssueContent:
+    data = read_json(issue_dir / ISSUE_FNAME)
+    messages = [read_json(p)['message'] for p in issue_dir.glob('comment-*')]
+    return data, messages
+
+
+def search_query(terms: Iterable[str]) -> str:
+    # Quote everything so that the user can't accidentally write fts5
+    # syntax, a term with spaces is a phrase and a trailing * is a prefix
+    parts = []
+    for term in terms:
+        prefix = term.endswith('*')
+        term = term.rstrip('*').replace('"', '""')
+        if term:
+            parts.append(f'"{term}"' + ('*' if prefix else ''))
+    return ' '.join(parts)
+
+
+def _index_key(issue_dir: Path) -> str:
+    return issue_dir.relative_to(ROOT).as_posix()
+
+
+def _stale_path(path: Path) -> Path:
+    return path.with_suffix('.stale')
+
+
+def mark_stale(path: Path = INDEX_PATH) -> None:
+    """Make the next refresh check every issue, eg. after a lost update."""
+    _stale_path(path).touch()
+
+
+class IssueIndex:
+    """
+    A cache of every issue file in the root, stored in an sqlite database.
+
+    Each issue directory is keyed by the mtime and size of its files,
+    so only issues that changed since the last refresh are parsed again.
+    Only the number of comments is stored, not the comments themselves,
+    but the description and comments are added to the search index.
+    """
+
+    def __init__(self, path: Path = INDEX_PATH) -> None:
+        self.path = path
+        self.conn = sqlite3.connect(str(path))
+        version: int = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        # A new index has to be refreshed before it can be trusted
+        self.is_new = version != SCHEMA_VERSION
+        if self.is_new:
+            self._create()
+        self.has_search = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'search'"
+        ).fetchone() is not None
+
+    def __enter__(self) -> 'IssueIndex':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _create(self) -> None:
+        with self.conn:
+            tables = [row[0] for row in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")]
+            for table in tables:
+                # Dropping the search table drops its shadow tables too
+                self.conn.execute(f'DROP TABLE IF EXISTS {table}')
+            self.conn.executescript(SCHEMA)
+            try:
+                self.conn.executescript(SEARCH_SCHEMA)
+            except sqlite3.OperationalError:
+                pass
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def _store(self, key: str, issue_dir: Path,
+               signature: Signature, data: Dict[str, Any],
+               messages: List[str]) -> None:
+        # Nothing reads the old log from here, so don't waste time on it
+        data.pop('log', None)
+        self.conn.execute(
+            'INSERT OR REPLACE INTO issues '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, issue_dir.parent.name.split('-', 1)[1], data['status'],
+             *signature,
+             json.dumps(data, separators=(',', ':')), len(messages),
+             data['id'], parse_timestamp(data['created']).timestamp(),
+             parse_timestamp(data['updated']).timestamp(),
+             data['description']))
+        self.conn.execute('DELETE FROM blocks WHERE path = ?', (key,))
+        self.conn.executemany(
+            'INSERT INTO blocks VALUES (?, ?, ?, ?, ?)',
+            ((key, data['user'], data['id'], b['user'], b['id'])
+             for b in data['blocked_by']))
+        self.conn.execute('DELETE FROM tags WHERE path = ?', (key,))
+        self.conn.executemany(
+            'INSERT INTO tags VALUES (?, ?, ?, ?)',
+            ((tag, key, data['user'], data['id']) for tag in data['tags']))
+        if self.has_search:
+            self._remove_search(key)
+            for text in [data['description']] + messages:
+                docid = self.conn.execute(
+                    'INSERT INTO search_docs (path) VALUES (?)',
+                    (key,)).lastrowid
+                self.conn.execute(
+                    'INSERT INTO search (rowid, text) VALUES (?, ?)',
+                    (docid, text))
+
+    def _remove_search(self, key: str) -> None:
+        docids = [(docid,) for docid, in self.conn.execute(
+            'SELECT docid FROM search_docs WHERE path = ?', (key,))]
+        self.conn.executemany('DELETE FROM search WHERE rowid = ?', docids)
+        self.conn.executemany('DELETE FROM search_docs WHERE docid = ?',
+                              docids)
+
+    def _remove(self, key: str) -> None:
+        self.conn.execute('DELETE FROM issues WHERE path = ?', (key,))
+        self.conn.execute('DELETE FROM blocks WHERE path = ?', (key,))
+        self.conn.execute('DELETE FROM tags WHERE path = ?', (key,))
+        if self.has_search:
+            self._remove_search(key)
+
+    def update(self, *issue_dirs: Path) -> None:
+        """Re-read specific issues, eg. right after they have been saved."""
+        with self.conn:
+            for issue_dir in issue_dirs:
+                key = _index_key(issue_dir)
+                try:
+                    signature = _signature(issue_dir)
+                except FileNotFoundError:
+                    self._remove(key)
+                else:
+                    self._store(key, issue_dir, signature,
+                                *_read_issue(issue_dir))
+
+    def _is_current(self, key: str) -> bool:
+        row = self.conn.execute(
+            'SELECT mtime, size, dir_mtime FROM issues WHERE path = ?',
+            (key,)).fetchone()
+        try:
+            return row is not None and tuple(row) == _signature(ROOT / key)
+        except FileNotFoundError:
+            return False
+
+    def refresh(self, workers: int = 1, use_processes: bool = False,
+                statuses: Optional[Collection[str]] = None) -> int:
+        """
+        Re-read every issue that changed on disk, return how many did.
+        With statuses, only issues last seen with one of them are checked.
+        """
+        try:
+            _stale_path(self.path).unlink()
+        except FileNotFoundError:
+            return self._refresh(workers, use_processes, statuses)
+        try:
+            return self._refresh(workers, use_processes, None)
+        except BaseException:
+            mark_stale(self.path)
+            raise
+
+    def _refresh(self, workers: int, use_processes: bool,
+                 statuses: Optional[Collection[str]]) -> int:
+        known: Dict[str, Signature] = {}
+        skipped: Set[str] = set()
+        for path, mtime, size, dir_mtime, status in self.conn.execute(
+                'SELECT path, mtime, size, dir_mtime, status FROM issues'):
+            # Other statuses are only changed by ishu, through update()
+            if statuses is None or status in statuses:
+                known[path] = (mtime, size, dir_mtime)
+            else:
+                skipped.add(path)
+        # Listing the directories is cheap, it's stat'ing them that isn't
+        with trace.phase('list directories'):
+            dirs = [d for d in chain.from_iterable(
+                        parallel_map(issue_dirs, list(user_paths()), workers))
+                    if _index_key(d) not in skipped]
+        trace.count('issues checked', len(dirs))
+        changed: List[Tuple[Path, Signature]] = []
+        with trace.phase('check for changes'):
+            for issue_dir, signature in zip(
+                    dirs, parallel_map(_signature_or_none, dirs, workers)):
+                if signature is None:
+                    continue
+                if known.pop(_index_key(issue_dir), None) != signature:
+                    changed.append((issue_dir, signature))
+        trace.count('issues changed', len(changed))
+        with trace.phase('read changed issues'):
+            parsed = parallel_map(_read_issue, [d for d, _ in changed],
+                                  workers, use_processes)
+        with trace.phase('update index'), self.conn:
+            for (issue_dir, signature), (data, messages) \
+                    in zip(changed, parsed):
+                self._store(_index_key(issue_dir), issue_dir, signature,
+                            data, messages)
+            for key in known:
+                self._remove(key)
+        self.is_new = False
+        return len(changed) + len(known)
+
+    def rebuild(self, workers: int = 1, use_processes: bool = False) -> int:
+        """Throw away the whole index and create it from scratch."""
+        self._create()
+        return self.refresh(workers, use_processes)
+
+    def entries(self, user: Optional[str] = None,
+                statuses: Optional[Collection[str]] = None,
+                search: Optional[str] = None,
+                tags: Collection[str] = (),
+                without_tags: Collection[str] = (),
+                sort: Optional[str] = None,
+                descending: bool = False) -> Iterator[IndexEntry]:
+        """Return the data of every matching issue, read as it's needed."""
+        conditions: List[str] = []
+        params: List[str] = []
+        query = 'SELECT data, comment_count FROM issues'
+        order = 'user, num'
+        if search is not None:
+            query += (' JOIN (SELECT search_docs.path AS search_path, '
+                      'MIN(search.rank) AS search_rank FROM search '
+                      'JOIN search_docs ON search_docs.docid = search.rowid '
+                      'WHERE search MATCH ? GROUP BY search_docs.path) '
+                      'ON search_path = path')
+            params.append(search)
+            order = 'search_rank, user, num'
+        if user:
+            conditions.append('user = ?')
+            params.append(user)
+        if statuses is not None:
+            conditions.append(
+                f'status IN ({", ".join("?" * len(statuses))})')
+            params.extend(statuses)
+        for tag in tags:
+            conditions.append('path IN (SELECT path FROM tags WHERE tag = ?)')
+            params.append(tag)
+        if without_tags:
+            conditions.append(
+                'path NOT IN (SELECT path FROM tags '
+                f'WHERE tag IN ({", ".join("?" * len(without_tags))}))')
+            params.extend(without_tags)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        if sort is not None:
+            direction = ' DESC' if descending else ''
+            order = ', '.join(f'{column}{direction}' for column in
+                              dict.fromkeys([SORT_COLUMNS[sort], 'num',
+                                             'user']))
+        for data, comment_count in self.conn.execute(
+                f'{query} ORDER BY {order}', params):
+            yield json.loads(data), comment_count
+
+    def tag_counts(self) -> Counter:
+        """Return how many issues are using each tag."""
+        return Counter(dict(self.conn.execute(
+            'SELECT tag, COUNT(*) FROM tags GROUP BY tag')))
+
+    def tagged(self, tags: Iterable[str]) -> List[Tuple[str, int]]:
+        """Return the IDs of all issues using any of the tags."""
+        tags = list(tags)
+        return self.conn.execute(
+            'SELECT DISTINCT user, num FROM tags '
+            f'WHERE tag IN ({", ".join("?" * len(tags))}) '
+            'ORDER BY user, num', tags).fetchall()
+
+    def blockers(self) -> List[Tuple[str, int]]:
+        """Return the IDs of all issues that are blocking another issue."""
+        return self.conn.execute(
+            'SELECT DISTINCT blocker_user, blocker_num FROM blocks '
+            'WHERE blocker_user != user OR blocker_num != num').fetchall()
+
+    def blocking(self, user: str, num: int) -> List[Tuple[str, int]]:
+        """Return the IDs of the issues blocked by an issue."""
+        if self.is_new or _stale_path(self.path).exists():
+            self.refresh()
+        query = ('SELECT path, user, num FROM blocks '
+                 'WHERE blocker_user = ? AND blocker_num = ? ORDER BY path')
+        rows = self.conn.execute(query, (user, num)).fetchall()
+        stale = [path for path, _, _ in rows if not self._is_current(path)]
+        if stale:
+            for path in stale:
+                self.update(ROOT / path)
+            rows = self.conn.execute(query, (user, num)).fetchall()
+        return [(blocked_user, blocked_num)
+                for _, blocked_user, blocked_num in rows]
@@ -1,17 +1,26 @@
+import contextlib
 from datetime import datetime, timezone
 import enum
-import json
-from pathlib import Path
+import heapq
+import os
 import re
+import sqlite3
+import sys
 import textwrap
-from typing import (Any, FrozenSet, Dict, Iterable, List, NamedTuple,
-                    Optional, Set)
+from typing import (Any, Callable, Collection, FrozenSet, Dict, Iterable,
+                    Iterator, List, NamedTuple, Optional, Set, Tuple)
 
 from libwui.cli import format_table
 from libwui.colors import BOLD, RESET
 
-from .common import (Config, issue_path, ISSUE_FNAME,
-                     TIMESTAMP_FMT, user_path, user_paths, usernames)
+from .common import (ACTIVITY_PATH, Config, INDEX_PATH, issue_lock,
+                     issue_path, PACK_PATH, parallel_map, parse_timestamp,
+                     ROOT, SQLITE_PATH, TIMESTAMP_FMT, user_paths,
+                     write_batch)
+from .activity import events_since, record_event
+from .index import IssueIndex, mark_stale, search_query
+from .storage import DirectoryStorage, get_storage, user_registry
+from . import trace
 
 
 class IssueID(NamedTuple):
@@ -22,14 +31,7 @@ class IssueID(NamedTuple):
         if config is not None and self.user == config.user:
             prefix = ''
         else:
-            users = usernames()
-            for i in range(1, len(self.user) - 1):
-                prefix = self.user[:i]
-                matches = [u for u in users if u.startswith(prefix)]
-                if len(matches) == 1:
-                    break
-            else:
-                prefix = self.user
+            prefix = user_registry().shorten(self.user)
         return f'{prefix}{self.num}'
 
     @classmethod
@@ -40,14 +42,14 @@ class IssueID(NamedTuple):
             if match is None:
                 raise ValueError('Invalid issue ID format')
             user_match = match['user']
-            users = usernames()
+            users = user_registry()
             user: str
             if user_match is None:
                 user = config.user
-            elif user_match in users:
+            elif user_match in users.users:
                 user = user_match
             else:
-                candidates = [u for u in users if u.startswith(user_match)]
+                candidates = users.matches(user_match)
                 if not candidates:
                     raise KeyError('Unknown user')
                 elif len(candidates) > 1:
@@ -59,7 +61,7 @@ class IssueID(NamedTuple):
         else:
             user = config.user
             num = int(abbr_id)
-        if not issue_path(user, num).exists():
+        if not get_storage().issue_exists(user, num):
             raise KeyError("Issue doesn't exist")
         return cls(user, num)
 
@@ -76,35 +78,25 @@ class Comment(NamedTuple):
         return '\n'.join([subject_line] + textwrap.wrap(self.message))
 
     @classmethod
-    def load(cls, file_path: Path) -> 'Comment':
-        data: Dict[str, Any] = json.loads(file_path.read_text())
-        # The old date doesn't play nice with strptime so convert it
-        # to the new one when needed
-        raw_created = data['created']
-        if raw_created.endswith('Z'):
-            raw_created = raw_created[:-1] + '+0000'
+    def from_data(cls, data: Dict[str, Any]) -> 'Comment':
         return cls(issue_id=IssueID(user=data['issue_id']['user'],
                                     num=data['issue_id']['num']),
                    user=data['user'],
-                   created=datetime.strptime(raw_created, TIMESTAMP_FMT),
+                   created=parse_timestamp(data['created']),
                    message=data['message'])
 
     def save(self) -> None:
-        path = issue_path(self.issue_id.user, self.issue_id.num).parent
-        now = self.created.strftime('%Y-%m-%dT%H-%M-%S')
-        suffix = 0
-        while True:
-            fname = f'comment-{now}{"-" + str(suffix) if suffix else ""}'
-            if not (path / fname).exists():
-                break
-            suffix += 1
-        (path / fname).write_text(json.dumps({
+        get_storage().add_comment(*self.issue_id, {
             'issue_id': {'user': self.issue_id.user,
                          'num': str(self.issue_id.num)},
             'user': self.user,
             'created': self.created.strftime(TIMESTAMP_FMT),
             'message': self.message
-        }, indent=2))
+        })
+        _update_index(self.issue_id)
+        first_line = self.message.splitlines()[0] if self.message else ''
+        record_event(self.created, self.user, self.issue_id, 'comment',
+                     first_line)
 
 
 @enum.unique
@@ -119,24 +111,89 @@ class IssueStatus(enum.Enum):
         return v
 
 
-class Issue(NamedTuple):
+# Statuses are stored as their index in this
+_STATUSES = tuple(IssueStatus)
+_STATUS_CODES = {status: code for code, status in enumerate(_STATUSES)}
+
+# Most issues share one of a handful of tag combinations, so every
+# combination is only kept in memory once
+_tag_sets: Dict[FrozenSet[str], FrozenSet[str]] = {}
+_NO_BLOCKERS: FrozenSet[IssueID] = frozenset()
+
+
+def _intern_tags(tags: Iterable[str]) -> FrozenSet[str]:
+    tag_set = frozenset(map(sys.intern, tags))
+    return _tag_sets.setdefault(tag_set, tag_set)
+
+
+# The description, tags, blocked_by and status code of an issue
+IssueSnapshot = Tuple[str, FrozenSet[str], FrozenSet[IssueID], int]
+
+
+class Issue:
+    # Never changed in place, like the NamedTuple it used to be, but
+    # slotted (with shared frozensets) to keep big trackers small in memory
+    __slots__ = ('id_', 'created', 'updated', 'description', 'tags',
+                 'blocked_by', 'comment_count', '_status', '_original')
+    _fields = ('id_', 'created', 'updated', 'description', 'tags',
+               'blocked_by', 'comment_count', 'status')
+
     id_: IssueID
     created: datetime
     updated: datetime
     description: str
-    tags: Set[str]
-    blocked_by: Set[IssueID]
-    comments: List[Comment]
-    status: IssueStatus
-    log: List[Dict[str, Any]]
-    original_description: str
-    original_tags: FrozenSet[str]
-    original_blocked_by: FrozenSet[IssueID]
-    original_status: IssueStatus
+    tags: FrozenSet[str]
+    blocked_by: FrozenSet[IssueID]
+    comment_count: int
+    _status: int
+    # What the issue looked like when it was loaded, if it has changed
+    _original: Optional[IssueSnapshot]
+
+    def __init__(self, id_: IssueID, created: datetime, updated: datetime,
+                 description: str, tags: Iterable[str],
+                 blocked_by: Iterable[IssueID], comment_count: int,
+                 status: IssueStatus,
+                 _original: Optional[IssueSnapshot] = None) -> None:
+        self.id_ = id_
+        self.created = created
+        self.updated = updated
+        self.description = description
+        self.tags = _intern_tags(tags)
+        self.blocked_by = frozenset(blocked_by) or _NO_BLOCKERS
+        self.comment_count = comment_count
+        self._status = _STATUS_CODES[status]
+        self._original = _original
+
+    @property
+    def status(self) -> IssueStatus:
+        return _STATUSES[self._status]
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}'
+                           for name in self._fields)
+        return f'Issue({fields})'
+
+    def _values(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Issue):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self) -> int:
+        return hash(self._values())
+
+    def _snapshot(self) -> IssueSnapshot:
+        return (self.description, self.tags, self.blocked_by, self._status)
+
+    def _replace(self, **changes: Any) -> 'Issue':
+        fields = {name: getattr(self, name) for name in self._fields}
+        fields.update(changes)
+        return Issue(**fields, _original=self._original or self._snapshot())
 
     def info(self, config: Config) -> str:
-        blocking_issues = [issue.id_ for issue in load_issues()
-                           if self.id_ in issue.blocked_by]
+        blocking_issues = find_blocked_issues(self.id_)
         table = [
             ('ID', str(self.id_.num)),
             ('User', self.id_.user),
@@ -154,92 +211,479 @@ class Issue(NamedTuple):
         table = [(BOLD + n + RESET, d) for n, d in table]
         info = '\n'.join(format_table(table, wrap_columns={1},
                                       column_spacing=3))
-        if self.comments:
-            comments = '\n\n'.join(map(str, self.comments))
+        if self.comment_count:
+            comments = '\n\n'.join(map(str, self.load_comments()))
             info += '\nComments:\n\n' + comments
         return info
 
     @classmethod
     def load_from_id(cls, id_: IssueID) -> 'Issue':
-        return cls.load(issue_path(*id_).parent)
+        storage = get_storage()
+        with trace.phase('read issue'):
+            data = storage.read_issue(*id_)
+        with trace.phase('count comments'):
+            comment_count = storage.comment_count(*id_)
+        with trace.phase('parse issue'):
+            return cls.from_data(data, comment_count)
 
     @classmethod
-    def load(cls, path: Path) -> 'Issue':
-        if path.name == ISSUE_FNAME:
-            path = path.parent
-        data: Dict[str, Any] = json.loads((path / ISSUE_FNAME).read_text())
-        comments = sorted((Comment.load(p) for p in path.glob('comment-*')),
-                          key=lambda x: x.created)
-        blocked_by = {IssueID(num=i['id'], user=i['user'])
-                      for i in data['blocked_by']}
-        # The old date doesn't play nice with strptime so convert it
-        # to the new one when needed
-        raw_created = data['created']
-        if raw_created.endswith('Z'):
-            raw_created = raw_created[:-1] + '+0000'
-        raw_updated = data['updated']
-        if raw_updated.endswith('Z'):
-            raw_updated = raw_updated[:-1] + '+0000'
-
-        return cls(id_=IssueID(num=data['id'], user=data['user']),
-                   created=datetime.strptime(raw_created, TIMESTAMP_FMT),
-                   updated=datetime.strptime(raw_updated, TIMESTAMP_FMT),
+    def from_data(cls, data: Dict[str, Any],
+                  comment_count: int) -> 'Issue':
+        return cls(id_=IssueID(num=data['id'], user=sys.intern(data['user'])),
+                   created=parse_timestamp(data['created']),
+                   updated=parse_timestamp(data['updated']),
                    description=data['description'],
-                   tags=set(data['tags']),
-                   blocked_by=blocked_by,
-                   comments=comments,
-                   status=IssueStatus(data['status']),
-                   # Backups for log diffs
-                   log=data.get('log', []),
-                   original_description=data['description'],
-                   original_tags=frozenset(data['tags']),
-                   original_blocked_by=frozenset(blocked_by),
-                   original_status=IssueStatus(data['status']))
+                   tags=data['tags'],
+                   blocked_by=[IssueID(num=i['id'], user=sys.intern(i['user']))
+                               for i in data['blocked_by']],
+                   comment_count=comment_count,
+                   status=IssueStatus(data['status']))
 
-    def save(self) -> None:
+    def load_comments(self) -> List[Comment]:
+        return sorted((Comment.from_data(data)
+                       for data in get_storage().read_comments(*self.id_)),
+                      key=lambda x: x.created)
+
+    def load_log(self) -> List[Dict[str, Any]]:
+        return get_storage().read_log(*self.id_)
+
+    def save(self, actor: Optional[str] = None) -> None:
         def encode_blocks(blocks: Iterable[IssueID]
                           ) -> List[Dict[str, Any]]:
             return sorted(({'id': b.num, 'user': b.user} for b in blocks),
                           key=lambda x: x['id'])
-        now = datetime.now(timezone.utc).strftime(TIMESTAMP_FMT)
+        now_dt = datetime.now(timezone.utc)
+        now = now_dt.strftime(TIMESTAMP_FMT)
         log_diff: Dict[str, Any] = {}
-        if self.description != self.original_description:
-            log_diff['description'] = self.original_description
-        if self.tags != self.original_tags:
-            log_diff['tags'] = sorted(self.original_tags)
-        if self.blocked_by != self.original_blocked_by:
-            log_diff['blocked_by'] = encode_blocks(self.original_blocked_by)
-        if self.status != self.original_status:
-            log_diff['status'] = self.original_status.value
-        if log_diff:
-            log_diff['timestamp'] = now
-            self.log.append(log_diff)
-        path = issue_path(*self.id_)
-        if not path.parent.exists():
-            path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(json.dumps({
-            'id': self.id_.num,
-            'user': self.id_.user,
-            'created': self.created.strftime(TIMESTAMP_FMT),
-            'updated': now,
-            'description': self.description,
-            'tags': sorted(self.tags),
-            'blocked_by': encode_blocks(self.blocked_by),
-            'status': self.status.value,
-            'log': self.log
-        }, indent=2))
+        if self._original is not None:
+            (original_description, original_tags, original_blocked_by,
+             original_status) = self._original
+            if self.description != original_description:
+                log_diff['description'] = original_description
+            if self.tags != original_tags:
+                log_diff['tags'] = sorted(original_tags)
+            if self.blocked_by != original_blocked_by:
+                log_diff['blocked_by'] = encode_blocks(original_blocked_by)
+            if self._status != original_status:
+                log_diff['status'] = _STATUSES[original_status].value
+        storage = get_storage()
+        with trace.phase('save issue'), issue_lock(*self.id_):
+            is_new = not storage.issue_exists(*self.id_)
+            if log_diff:
+                log_diff['timestamp'] = now
+                storage.append_log(*self.id_, log_diff)
+            storage.write_issue(*self.id_, {
+                'id': self.id_.num,
+                'user': self.id_.user,
+                'created': self.created.strftime(TIMESTAMP_FMT),
+                'updated': now,
+                'description': self.description,
+                'tags': sorted(self.tags),
+                'blocked_by': encode_blocks(self.blocked_by),
+                'status': self.status.value,
+            })
+        _update_index(self.id_)
+        if is_new:
+            record_event(now_dt, actor or self.id_.user, self.id_, 'open',
+                         self.description)
+        elif 'status' in log_diff:
+            record_event(now_dt, actor, self.id_, 'status',
+                         self.status.value)
+        elif log_diff:
+            record_event(now_dt, actor, self.id_, 'edit',
+                         ', '.join(k.replace('_', ' ') for k in log_diff
+                                   if k != 'timestamp'))
+
+
+class IssueFilter(NamedTuple):
+    user: Optional[str] = None
+    status: Optional[IssueStatus] = None
+    tags: FrozenSet[str] = frozenset()
+    without_tags: FrozenSet[str] = frozenset()
+    # Words or phrases that have to be in the description or comments,
+    # or prefixes if they end with *
+    search_terms: Tuple[str, ...] = ()
+
+    def statuses(self) -> Optional[FrozenSet[IssueStatus]]:
+        if self.status is None:
+            return None
+        elif self.status == IssueStatus.CLOSED:
+            # Closed means every kind of closed
+            return frozenset(s for s in IssueStatus if s != IssueStatus.OPEN)
+        else:
+            return frozenset([self.status])
+
+    def matches_tags(self, tags: Collection[str]) -> bool:
+        return (self.tags.issubset(tags)
+                and self.without_tags.isdisjoint(tags))
+
+    def matches_text(self, issue: Issue) -> bool:
+        # Only a rough version of the real search, for when there's no index
+        texts = [issue.description.lower()]
+        if issue.comment_count:
+            texts.extend(c.message.lower() for c in issue.load_comments())
+        return all(any(term.rstrip('*').lower() in text for text in texts)
+                   for term in self.search_terms)
+
+    def matches(self, issue: Issue) -> bool:
+        statuses = self.statuses()
+        return ((self.user is None or issue.id_.user == self.user)
+                and (statuses is None or issue.status in statuses)
+                and self.matches_tags(issue.tags)
+                and (not self.search_terms or self.matches_text(issue)))
+
+
+# Everything is sorted by ID after the key, so that the order is the same
+# wherever the issues come from (and the same as in the index)
+SORT_KEYS: Dict[str, Callable[[Issue], Any]] = {
+    'id': lambda i: (i.id_.num, i.id_.user),
+    'created': lambda i: (i.created, i.id_.num, i.id_.user),
+    'updated': lambda i: (i.updated, i.id_.num, i.id_.user),
+    'comments': lambda i: (i.comment_count, i.id_.num, i.id_.user),
+    'description': lambda i: (i.description, i.id_.num, i.id_.user),
+}
+
+
+class IssueSort(NamedTuple):
+    # One of SORT_KEYS
+    key: str = 'id'
+    reverse: bool = False
+
+
+class _Reversed:
+    # Compares the other way around, since not every key can be negated
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __lt__(self, other: '_Reversed') -> bool:
+        return other.value < self.value
+
+
+def sort_lazily(issues: Iterable[Issue], sort: IssueSort) -> Iterator[Issue]:
+    # Making a heap is O(n) and taking each issue O(log n), so taking the
+    # first few of a long list is a lot quicker than sorting all of it
+    key = SORT_KEYS[sort.key]
+    heap = [(_Reversed(key(issue)) if sort.reverse else key(issue), issue)
+            for issue in issues]
+    heapq.heapify(heap)
+    while heap:
+        yield heapq.heappop(heap)[1]
+
+
+def allocate_issue_id(user: str) -> IssueID:
+    num = get_storage().allocate_id(user)
+    if user not in user_registry().users:
+        user_registry.cache_clear()
+    return IssueID(user=user, num=num)
+
+
+@contextlib.contextmanager
+def locked_issue(id_: IssueID) -> Iterator[None]:
+    # Hold this while loading, changing and saving an issue
+    with issue_lock(*id_):
+        # Anything saved by whoever had the lock before has to be seen
+        get_storage().refresh()
+        yield
+
+
+# Issues saved inside batched_writes(), waiting to be indexed
+_pending_index_updates: Optional[List[IssueID]] = None
+
+
+@contextlib.contextmanager
+def batched_writes() -> Iterator[None]:
+    global _pending_index_updates
+    if _pending_index_updates is not None:
+        # Already batching
+        yield
+        return
+    _pending_index_updates = []
+    try:
+        with write_batch():
+            yield
+    finally:
+        issue_ids, _pending_index_updates = _pending_index_updates, None
+        _update_index(*issue_ids)
+
+
+def _uses_index() -> bool:
+    # The index is a cache of the issue directories, packed issues
+    # are already quick enough to read without it
+    return isinstance(get_storage(), DirectoryStorage)
+
+
+def _update_index(*issue_ids: IssueID) -> None:
+    if _pending_index_updates is not None:
+        _pending_index_updates.extend(issue_ids)
+        return
+    if not issue_ids or not INDEX_PATH.exists() or not _uses_index():
+        return
+    try:
+        with IssueIndex() as index:
+            index.update(*(issue_path(*id_).parent for id_ in issue_ids))
+    except sqlite3.Error:
+        # Most likely another process had the index locked. Issues that
+        # changed status wouldn't be checked by the next refresh.
+        mark_stale()
+
+
+def find_blocked_issues(id_: IssueID) -> List[IssueID]:
+    if _issue_cache is not None:
+        return [issue.id_ for issue in _issue_cache.sorted_issues()
+                if id_ in issue.blocked_by]
+    if not _uses_index():
+        return [issue.id_ for issue in load_issues_from_files()
+                if id_ in issue.blocked_by]
+    try:
+        with IssueIndex() as index:
+            return [IssueID(user, num)
+                    for user, num in index.blocking(*id_)]
+    except sqlite3.Error:
+        return [issue.id_ for issue in load_issues_from_files()
+                if id_ in issue.blocked_by]
+
+
+def blocking_map(issues: Iterable[Issue]) -> Dict[IssueID, Set[IssueID]]:
+    blocking: Dict[IssueID, Set[IssueID]] = {}
+    for issue in issues:
+        for blocker in issue.blocked_by:
+            if blocker != issue.id_:
+                blocking.setdefault(blocker, set()).add(issue.id_)
+    return blocking
+
+
+def _load_issue_or_none(id_: IssueID) -> Optional[Issue]:
+    try:
+        return Issue.load_from_id(id_)
+    except FileNotFoundError:
+        # Claimed by allocate_issue_id but not saved yet
+        return None
+
+
+def load_issues_from_files(user: Optional[str] = None, workers: int = 1,
+                           use_processes: bool = False) -> List['Issue']:
+    # TODO: maybe do something special for a user that doesn't exist?
+    storage = get_storage()
+    if not isinstance(storage, DirectoryStorage):
+        # Only reading lots of small files benefits from more workers
+        workers = 1
+    with trace.phase('list issues'):
+        ids = [IssueID(*key) for key in storage.issue_ids(user, workers)]
+    with trace.phase('load issues'):
+        return [issue for issue in parallel_map(_load_issue_or_none, ids,
+                                                workers, use_processes)
+                if issue is not None]
+
+
+def _default_workers() -> int:
+    try:
+        return int(os.environ.get('ISHU_WORKERS', 1))
+    except ValueError:
+        return 1
+
+
+def open_index(statuses: Optional[Collection[IssueStatus]] = None
+               ) -> Optional[IssueIndex]:
+    # Only issues with these statuses are checked against the disk
+    if not _uses_index():
+        return None
+    try:
+        index = IssueIndex()
+    except sqlite3.Error:
+        return None
+    try:
+        with trace.phase('refresh index'):
+            index.refresh(workers=_default_workers(),
+                          statuses=(None if statuses is None
+                                    else {s.value for s in statuses}))
+    except sqlite3.Error:
+        index.close()
+        return None
+    return index
+
+
+def _sorted_matching(issues: Iterable[Issue], filter: IssueFilter,
+                     sort: Optional[IssueSort]) -> Iterator[Issue]:
+    matching = (issue for issue in issues if filter.matches(issue))
+    return matching if sort is None else sort_lazily(matching, sort)
+
+
+def _open_index_for(filter: IssueFilter) -> Optional[IssueIndex]:
+    index = open_index(filter.statuses())
+    if index is not None and filter.search_terms and not index.has_search:
+        index.close()
+        return None
+    return index
+
+
+def _index_issues(index: IssueIndex, filter: IssueFilter,
+                  sort: Optional[IssueSort]) -> Iterator[Issue]:
+    statuses = filter.statuses()
+    search = search_query(filter.search_terms) if filter.search_terms else None
+    with index:
+        entries = index.entries(
+            filter.user,
+            None if statuses is None else {s.value for s in statuses},
+            search, filter.tags, filter.without_tags,
+            None if sort is None else sort.key,
+            sort is not None and sort.reverse)
+        for data, comment_count in trace.iterate('query index', entries):
+            with trace.phase('parse issue'):
+                issue = Issue.from_data(data, comment_count)
+            yield issue
+
+
+def iter_issues(filter: IssueFilter = IssueFilter(),
+                sort: Optional[IssueSort] = None) -> Iterator[Issue]:
+    # Sorted issues are found as they're taken, so taking a few is quick
+    if not ROOT.exists():
+        return
+    if _issue_cache is not None:
+        yield from _sorted_matching(_issue_cache.sorted_issues(), filter,
+                                    sort)
+        return
+    index = _open_index_for(filter)
+    if index is None:
+        # The index is only a cache, so never let it stop us
+        yield from _sorted_matching(load_issues_from_files(
+            filter.user, workers=_default_workers()), filter, sort)
+        return
+    yield from _index_issues(index, filter, sort)
+
+
+def iter_issues_and_blockers(filter: IssueFilter = IssueFilter(),
+                             sort: Optional[IssueSort] = None
+                             ) -> Tuple[Iterator[Issue], Set[IssueID]]:
+    # Same as iter_issues() plus blocking issues, without loading twice
+    if not ROOT.exists():
+        return iter(()), set()
+    if _issue_cache is not None:
+        return iter_issues(filter, sort), _issue_cache.blocking_ids()
+    index = _open_index_for(filter)
+    if index is None:
+        # Blocking issues can be anywhere, so load everything
+        issues = load_issues_from_files(workers=_default_workers())
+        return (_sorted_matching(issues, filter, sort),
+                set(blocking_map(issues)))
+    blockers = {IssueID(user, num) for user, num in index.blockers()}
+    return _index_issues(index, filter, sort), blockers
 
 
 def load_issues(user: Optional[str] = None) -> List['Issue']:
-    issues: List['Issue'] = []
-    if user:
+    return list(iter_issues(IssueFilter(user=user)))
+
+
+def _storage_layout() -> Tuple[Optional[int], ...]:
+    # Packing or unpacking always replaces these, even if they come back
+    layout: List[Optional[int]] = []
+    for path in (PACK_PATH, SQLITE_PATH):
+        try:
+            layout.append(path.stat().st_ino)
+        except FileNotFoundError:
+            layout.append(None)
+    return tuple(layout)
+
+
+def _user_dir_mtimes() -> Dict[str, float]:
+    # Adding or removing an issue directory changes these, however it's
+    # done, but changing the files in one doesn't
+    mtimes = {}
+    for path in user_paths():
+        try:
+            mtimes[path.name.split('-', 1)[1]] = path.stat().st_mtime
+        except FileNotFoundError:
+            continue
+    return mtimes
+
+
+class IssueCache:
+    # For ishu serve. sync() only picks up changes made through ishu and
+    # issues added or removed by hand, anything else needs a reload()
+
+    def __init__(self) -> None:
+        self.issues: Dict[IssueID, Issue] = {}
+        self._sorted: Optional[List[Issue]] = None
+        self._blocking: Optional[Set[IssueID]] = None
+        self._activity_pos = 0
+        self._layout: Tuple[Optional[int], ...] = ()
+        self._user_mtimes: Dict[str, float] = {}
+        self.reload()
+
+    def reload(self) -> None:
+        get_storage.cache_clear()
+        user_registry.cache_clear()
+        self._layout = _storage_layout()
+        self._user_mtimes = _user_dir_mtimes()
         try:
-            issues = [Issue.load(p) for p
-                      in sorted(user_path(user).iterdir())]
+            self._activity_pos = ACTIVITY_PATH.stat().st_size
         except FileNotFoundError:
-            # TODO: maybe do something special for a user that doesn't exist?
-            pass
-    else:
-        for userdir in user_paths():
-            issues.extend(Issue.load(p) for p in sorted(userdir.iterdir()))
-    return issues
+            self._activity_pos = 0
+        self.issues = {issue.id_: issue for issue in load_issues_from_files(
+            workers=_default_workers())}
+        self._sorted = self._blocking = None
+
+    def sync(self) -> None:
+        if _storage_layout() != self._layout:
+            self.reload()
+            return
+        try:
+            size = ACTIVITY_PATH.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if size < self._activity_pos:
+            # The log has been truncated or replaced
+            self.reload()
+            return
+        events, self._activity_pos = events_since(self._activity_pos)
+        changed = {IssueID(*event.issue_id) for event in events}
+        if isinstance(get_storage(), DirectoryStorage):
+            changed.update(self._changed_issue_dirs())
+        if not changed:
+            return
+        get_storage().refresh()
+        if any(id_.user not in user_registry().users for id_ in changed):
+            user_registry.cache_clear()
+        for id_ in changed:
+            issue = _load_issue_or_none(id_)
+            if issue is None:
+                self.issues.pop(id_, None)
+            else:
+                self.issues[id_] = issue
+        self._sorted = self._blocking = None
+
+    def _changed_issue_dirs(self) -> Set[IssueID]:
+        # Issues added or removed without ishu, eg. by git pull, in the
+        # users' directories that have changed since last time
+        mtimes = _user_dir_mtimes()
+        changed: Set[IssueID] = set()
+        for user in set(mtimes).union(self._user_mtimes):
+            if mtimes.get(user) == self._user_mtimes.get(user):
+                continue
+            on_disk = {IssueID(user, num)
+                       for _, num in get_storage().issue_ids(user)}
+            cached = {id_ for id_ in self.issues if id_.user == user}
+            changed.update(on_disk.symmetric_difference(cached))
+        self._user_mtimes = mtimes
+        return changed
+
+    def sorted_issues(self) -> List[Issue]:
+        if self._sorted is None:
+            self._sorted = sorted(self.issues.values(),
+                                  key=lambda issue: issue.id_)
+        return self._sorted
+
+    def blocking_ids(self) -> Set[IssueID]:
+        if self._blocking is None:
+            self._blocking = set(blocking_map(self.issues.values()))
+        return set(self._blocking)
+
+
+# Used instead of the files or the index when set
+_issue_cache: Optional[IssueCache] = None
+
+
+def use_issue_cache(cache: Optional[IssueCache]) -> None:
+    global _issue_cache
+    _issue_cache = cache
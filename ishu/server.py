@@ -0,0 +1,148 @@
+"""Keep every issue in memory and run commands sent by client.py."""
+from contextlib import redirect_stderr, redirect_stdout, suppress
+import io
+import os
+import signal
+import socket
+import time
+import traceback
+from types import FrameType
+from typing import Any, Callable, Dict, List, Optional
+
+from .client import FORWARDED_ENV, recv_message, send_message
+from .common import SOCKET_PATH
+from .models import IssueCache, use_issue_cache
+
+# Reload everything this often (in seconds), however busy the server is,
+# to pick up changes that were made without ishu
+RELOAD_INTERVAL = 60
+
+
+def _set_env(env: Dict[str, Optional[str]]) -> None:
+    for name, value in env.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    if 'TZ' in env and hasattr(time, 'tzset'):
+        # The local timezone is only read from TZ when told to
+        time.tzset()
+
+
+def _run_captured(run: Callable[[List[str]], None],
+                  request: Dict[str, Any]) -> Dict[str, Any]:
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    status = 0
+    env = {name: value for name, value in request.get('env', {}).items()
+           if name in FORWARDED_ENV}
+    old_env = {name: os.environ.get(name) for name in env}
+    _set_env(env)
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                run(list(request['args']))
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    status = e.code or 0
+                else:
+                    print(e.code, file=stderr)
+                    status = 1
+            except Exception:
+                traceback.print_exc()
+                status = 1
+    finally:
+        _set_env(old_env)
+    return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(),
+            'status': status}
+
+
+def _bind(path: str) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(path):
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Nobody's listening, so it's left over from a crash. Anything
+            # else (like another user's server) is none of our business.
+            with suppress(FileNotFoundError):
+                os.remove(path)
+            sock.close()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock.close()
+            raise FileExistsError(path)
+    # Nobody else gets to run commands as us
+    old_umask = os.umask(0o077)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(old_umask)
+    sock.listen()
+    return sock
+
+
+def _update(cache: IssueCache, full: bool) -> bool:
+    # Return whether it worked, so that a failed sync can be followed by
+    # a full reload, instead of taking the whole server down
+    try:
+        if full:
+            cache.reload()
+        else:
+            cache.sync()
+    except Exception:
+        traceback.print_exc()
+        return False
+    return True
+
+
+def _interrupt(signum: int, frame: Optional[FrameType]) -> None:
+    raise KeyboardInterrupt
+
+
+def serve(run: Callable[[List[str]], None]) -> None:
+    """
+    Run commands sent to SOCKET_PATH with run() until interrupted.
+    Raise FileExistsError if another server is already running there.
+    """
+    path = str(SOCKET_PATH)
+    sock = _bind(path)
+    # Shut down cleanly when killed too
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        cache = IssueCache()
+        use_issue_cache(cache)
+        print(f'Serving {len(cache.issues)} issues on {path}')
+        next_reload = time.monotonic() + RELOAD_INTERVAL
+        needs_reload = False
+        while True:
+            # Not only when idle, since a busy server might never be
+            timeout = next_reload - time.monotonic()
+            if timeout <= 0:
+                needs_reload = not _update(cache, full=True)
+                next_reload = time.monotonic() + RELOAD_INTERVAL
+                continue
+            sock.settimeout(timeout)
+            try:
+                conn, _ = sock.accept()
+            except socket.timeout:
+                continue
+            with conn:
+                conn.settimeout(None)
+                try:
+                    request = recv_message(conn)
+                except (OSError, ValueError):
+                    continue
+                needs_reload = not _update(cache, full=needs_reload)
+                response = _run_captured(run, request)
+                try:
+                    send_message(conn, response)
+                except OSError:
+                    # The client gave up, but the command has still run
+                    pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        use_issue_cache(None)
+        sock.close()
+        os.remove(path)
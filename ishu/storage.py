@@ -0,0 +1,731 @@
+from abc import ABC, abstractmethod
+import contextlib
+from itertools import chain
+import functools
+import json
+import mmap
+import os
+from pathlib import Path
+import shutil
+import sqlite3
+from typing import (Any, Dict, FrozenSet, Iterable, Iterator, List, Optional,
+                    Tuple)
+
+from .common import (append_text, atomic_write_text, comment_paths,
+                     count_comments, DURABILITY, Durability, file_lock,
+                     INDEX_PATH, issue_dirs, issue_lock, issue_path, log_path,
+                     next_id_path, PACK_PATH, parallel_map, parse_json_lines,
+                     parse_timestamp, read_json, root_lock, SQLITE_PATH,
+                     TAGS_PATH, user_path, user_paths, UserRegistry,
+                     usernames, write_batch)
+from . import trace
+
+
+IssueKey = Tuple[str, int]
+
+
+class Storage(ABC):
+    """
+    Where the issues, their comments and their logs are kept.
+
+    Everything is passed around as the same dicts that are stored in the
+    JSON files, so the backends don't need to know anything about the
+    models. Callers are responsible for locking, except for allocate_id.
+
+    Reading the comments or log of an issue that doesn't exist gives
+    nothing rather than an error. benchmarks/storage.py checks that every
+    backend behaves the same.
+    """
+
+    def close(self) -> None:
+        pass
+
+    def refresh(self) -> None:
+        """Pick up changes made by other processes, if that's not automatic."""
+        pass
+
+    @abstractmethod
+    def users(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def allocate_id(self, user: str) -> int:
+        """Return a new issue number that nobody else will get."""
+
+    @abstractmethod
+    def issue_ids(self, user: Optional[str] = None,
+                  workers: int = 1) -> List[IssueKey]:
+        """
+        Return the IDs of all issues, sorted. This may include IDs that
+        have been allocated but not written yet.
+        """
+
+    @abstractmethod
+    def issue_exists(self, user: str, num: int) -> bool:
+        ...
+
+    @abstractmethod
+    def read_issue(self, user: str, num: int) -> Dict[str, Any]:
+        """Raise FileNotFoundError if the issue doesn't exist."""
+
+    @abstractmethod
+    def write_issue(self, user: str, num: int, data: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def comment_count(self, user: str, num: int) -> int:
+        ...
+
+    @abstractmethod
+    def read_comments(self, user: str, num: int) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def add_comment(self, user: str, num: int, data: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def read_log(self, user: str, num: int) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def append_log(self, user: str, num: int, entry: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def read_tags(self) -> FrozenSet[str]:
+        ...
+
+    @abstractmethod
+    def write_tags(self, tags: Iterable[str]) -> None:
+        ...
+
+
+class _FileStorage(Storage):
+    """
+    The parts shared by the backends that keep users, ID counters and
+    the tag registry as plain files in the root.
+    """
+
+    @abstractmethod
+    def claim_id(self, user: str, num: int) -> bool:
+        """Reserve an issue ID, return False if it's already taken."""
+
+    def users(self) -> List[str]:
+        return list(usernames())
+
+    def allocate_id(self, user: str) -> int:
+        counter_path = next_id_path(user)
+        with root_lock():
+            try:
+                num = int(counter_path.read_text())
+            except (FileNotFoundError, ValueError):
+                # No counter yet, so fall back to looking at the issues
+                num = max((n for _, n in self.issue_ids(user)),
+                          default=0) + 1
+            user_path(user).mkdir(parents=True, exist_ok=True)
+            # Claiming the ID also protects against the counter being
+            # behind the actual issues
+            while not self.claim_id(user, num):
+                num += 1
+            atomic_write_text(counter_path, str(num + 1))
+        return num
+
+    def read_tags(self) -> FrozenSet[str]:
+        if not TAGS_PATH.exists():
+            return frozenset()
+        return frozenset(json.loads(TAGS_PATH.read_text()))
+
+    def write_tags(self, tags: Iterable[str]) -> None:
+        atomic_write_text(TAGS_PATH, json.dumps(sorted(tags), indent=2))
+
+
+# == One directory per issue ==
+
+def _read_journal(path: Path) -> List[Dict[str, Any]]:
+    try:
+        lines = path.read_text().splitlines()
+    except FileNotFoundError:
+        return []
+    return list(parse_json_lines(lines))
+
+
+def _merge_logs(old_log: List[Dict[str, Any]],
+                journal: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # If a crash happened halfway through moving an old log to the
+    # journal, some of the entries may already be in both
+    return old_log + [entry for entry in journal if entry not in old_log]
+
+
+class DirectoryStorage(_FileStorage):
+    """
+    The original layout: user-<name>/issue-<num>/ with an issue file,
+    a log journal and one file per comment.
+    """
+
+    def issue_ids(self, user: Optional[str] = None,
+                  workers: int = 1) -> List[IssueKey]:
+        userdirs = [user_path(user)] if user else list(user_paths())
+        keys = []
+        for issue_dir in chain.from_iterable(
+                parallel_map(issue_dirs, userdirs, workers)):
+            num = issue_dir.name.split('-', 1)[1]
+            if num.isdigit():
+                keys.append((issue_dir.parent.name.split('-', 1)[1],
+                             int(num)))
+        return sorted(keys)
+
+    def issue_exists(self, user: str, num: int) -> bool:
+        return issue_path(user, num).exists()
+
+    def claim_id(self, user: str, num: int) -> bool:
+        # Creating the directory claims the ID
+        try:
+            issue_path(user, num).parent.mkdir()
+        except FileExistsError:
+            return False
+        return True
+
+    def read_issue(self, user: str, num: int) -> Dict[str, Any]:
+        data: Dict[str, Any] = read_json(issue_path(user, num))
+        return data
+
+    def write_issue(self, user: str, num: int, data: Dict[str, Any]) -> None:
+        path = issue_path(user, num)
+        if not path.parent.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            old_log = self.read_issue(user, num).get('log')
+        except FileNotFoundError:
+            old_log = None
+        if old_log:
+            # Old issues kept their log in the issue file itself, so move
+            # it out before the file is rewritten
+            journal = _merge_logs(old_log, _read_journal(log_path(user, num)))
+            atomic_write_text(log_path(user, num),
+                              ''.join(json.dumps(entry) + '\n'
+                                      for entry in journal))
+        atomic_write_text(path, json.dumps(data, indent=2))
+
+    def comment_count(self, user: str, num: int) -> int:
+        try:
+            return count_comments(issue_path(user, num).parent)
+        except FileNotFoundError:
+            return 0
+
+    def read_comments(self, user: str, num: int) -> List[Dict[str, Any]]:
+        return [read_json(p) for p in comment_paths(user, num)]
+
+    def add_comment(self, user: str, num: int, data: Dict[str, Any]) -> None:
+        path = issue_path(user, num).parent
+        created = parse_timestamp(data['created'])
+        now = created.strftime('%Y-%m-%dT%H-%M-%S')
+        text = json.dumps(data, indent=2)
+        suffix = 0
+        while True:
+            fname = f'comment-{now}{"-" + str(suffix) if suffix else ""}'
+            try:
+                atomic_write_text(path / fname, text, exclusive=True)
+            except FileExistsError:
+                suffix += 1
+            else:
+                break
+
+    def read_log(self, user: str, num: int) -> List[Dict[str, Any]]:
+        try:
+            old_log = self.read_issue(user, num).get('log', [])
+        except FileNotFoundError:
+            old_log = []
+        return _merge_logs(old_log, _read_journal(log_path(user, num)))
+
+    def append_log(self, user: str, num: int, entry: Dict[str, Any]) -> None:
+        append_text(log_path(user, num), json.dumps(entry) + '\n')
+
+
+# == Pack files ==
+
+# Segments are never rewritten, a new one is started when this is reached
+SEGMENT_SIZE = 64 * 1024 * 1024
+# Save the offset index on load once this many records are missing from it
+INDEX_SAVE_THRESHOLD = 256
+PACK_INDEX_FNAME = 'index'
+
+# Segment number, offset and length of a record's body
+Location = Tuple[int, int, int]
+
+
+class _PackedIssue:
+    __slots__ = ('issue', 'comments', 'log')
+
+    def __init__(self) -> None:
+        self.issue: Optional[Location] = None
+        self.comments: List[Location] = []
+        self.log: List[Location] = []
+
+
+def _segment_name(segment: int) -> str:
+    return f'segment-{segment:06d}'
+
+
+class PackStorage(_FileStorage):
+    """
+    Every issue, comment and log entry as a record in a few append-only
+    segment files, which are read with mmap.
+
+    A record is a header line with its kind, issue ID and length, then
+    the JSON body and a newline. The newest issue record wins. Where the
+    records of each issue are is kept in an offset index, which is saved
+    now and then and otherwise rebuilt from the end of the segments.
+
+    Records added by other processes are picked up by refresh(), which
+    is called when listing issues and when an issue isn't found.
+    """
+
+    def __init__(self, path: Path = PACK_PATH) -> None:
+        self.path = path
+        self._issues: Dict[IssueKey, _PackedIssue] = {}
+        # How far each segment has been read
+        self._scanned: Dict[int, int] = {}
+        self._maps: Dict[int, mmap.mmap] = {}
+        # Records that aren't in the saved offset index yet
+        self._unsaved = 0
+        self._load_index()
+        self.refresh()
+        if self._unsaved >= INDEX_SAVE_THRESHOLD:
+            try:
+                self.save_index()
+            except OSError:
+                # Probably a read-only root, which is fine
+                pass
+
+    # Reading
+
+    def _segments(self) -> List[int]:
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name.split('-', 1)[1]) for name in names
+                      if name.startswith('segment-'))
+
+    def _map(self, segment: int, size: int) -> mmap.mmap:
+        # Segments only ever grow, so a map is only outdated if it's short
+        segment_map = self._maps.get(segment)
+        if segment_map is None or len(segment_map) < size:
+            with (self.path / _segment_name(segment)).open('rb') as f:
+                segment_map = mmap.mmap(f.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+            self._maps[segment] = segment_map
+        return segment_map
+
+    def _read(self, location: Location) -> Any:
+        segment, offset, length = location
+        data = self._map(segment, offset + length)
+        trace.count('records read')
+        trace.count('bytes read', length)
+        return json.loads(data[offset:offset + length])
+
+    def _scan(self, segment: int, start: int, size: int) -> int:
+        data = self._map(segment, size)
+        pos = start
+        while True:
+            eol = data.find(b'\n', pos, size)
+            if eol == -1:
+                break
+            try:
+                kind, user, raw_num, raw_length = \
+                    data[pos:eol].decode().split(' ')
+                num, length = int(raw_num), int(raw_length)
+            except ValueError:
+                break
+            end = eol + 1 + length
+            if end + 1 > size:
+                # Still being written, or cut off by a crash
+                break
+            self._add_record(kind, user, num, (segment, eol + 1, length))
+            pos = end + 1
+        return pos
+
+    def _add_record(self, kind: str, user: str, num: int,
+                    location: Location) -> None:
+        packed = self._issues.setdefault((user, num), _PackedIssue())
+        if kind == 'issue':
+            packed.issue = location
+        elif kind == 'comment':
+            packed.comments.append(location)
+        elif kind == 'log':
+            packed.log.append(location)
+        self._unsaved += 1
+
+    def refresh(self) -> None:
+        """Read the records other processes have added since last time."""
+        for segment in self._segments():
+            size = (self.path / _segment_name(segment)).stat().st_size
+            if size > self._scanned.get(segment, 0):
+                self._scanned[segment] = self._scan(
+                    segment, self._scanned.get(segment, 0), size)
+
+    def _load_index(self) -> None:
+        try:
+            data = json.loads((self.path / PACK_INDEX_FNAME).read_text())
+        except (FileNotFoundError, ValueError):
+            return
+        self._scanned = {int(s): pos for s, pos in data['scanned'].items()}
+        for user, num, issue, comments, log in data['issues']:
+            packed = _PackedIssue()
+            packed.issue = tuple(issue) if issue else None
+            packed.comments = [tuple(c) for c in comments]
+            packed.log = [tuple(e) for e in log]
+            self._issues[(user, num)] = packed
+
+    def save_index(self) -> None:
+        # Only a cache of what's in the segments, so never synced
+        atomic_write_text(self.path / PACK_INDEX_FNAME, json.dumps({
+            'scanned': self._scanned,
+            'issues': [[user, num, p.issue, p.comments, p.log]
+                       for (user, num), p in self._issues.items()],
+        }, separators=(',', ':')))
+        self._unsaved = 0
+
+    def close(self) -> None:
+        for segment_map in self._maps.values():
+            segment_map.close()
+        self._maps.clear()
+
+    def _packed(self, user: str, num: int) -> Optional[_PackedIssue]:
+        packed = self._issues.get((user, num))
+        if packed is None or packed.issue is None:
+            self.refresh()
+            packed = self._issues.get((user, num))
+        return packed
+
+    def issue_ids(self, user: Optional[str] = None,
+                  workers: int = 1) -> List[IssueKey]:
+        self.refresh()
+        return sorted(key for key, packed in self._issues.items()
+                      if packed.issue is not None
+                      and (user is None or key[0] == user))
+
+    def issue_exists(self, user: str, num: int) -> bool:
+        packed = self._packed(user, num)
+        return packed is not None and packed.issue is not None
+
+    def claim_id(self, user: str, num: int) -> bool:
+        # There's nothing to create, allocate_issue_id's counter is
+        # enough as long as the ID isn't in use already
+        return not self.issue_exists(user, num)
+
+    def read_issue(self, user: str, num: int) -> Dict[str, Any]:
+        packed = self._packed(user, num)
+        if packed is None or packed.issue is None:
+            raise FileNotFoundError(f'No issue {user}/{num} in the pack')
+        data: Dict[str, Any] = self._read(packed.issue)
+        return data
+
+    def comment_count(self, user: str, num: int) -> int:
+        packed = self._packed(user, num)
+        return len(packed.comments) if packed is not None else 0
+
+    def read_comments(self, user: str, num: int) -> List[Dict[str, Any]]:
+        packed = self._packed(user, num)
+        if packed is None:
+            return []
+        return [self._read(location) for location in packed.comments]
+
+    def read_log(self, user: str, num: int) -> List[Dict[str, Any]]:
+        packed = self._packed(user, num)
+        if packed is None:
+            return []
+        return [self._read(location) for location in packed.log]
+
+    # Writing
+
+    def _append(self, kind: str, user: str, num: int, body: Any) -> None:
+        # ensure_ascii keeps the length in characters the same as in bytes
+        text = json.dumps(body, ensure_ascii=True)
+        with file_lock('pack'):
+            self.path.mkdir(exist_ok=True)
+            self.refresh()
+            segments = self._segments() or [1]
+            segment = segments[-1]
+            path = self.path / _segment_name(segment)
+            end = self._scanned.get(segment, 0)
+            if path.exists() and path.stat().st_size > end:
+                # Throw away a record that was cut off by a crash
+                os.truncate(path, end)
+            if end >= SEGMENT_SIZE:
+                segment += 1
+                path = self.path / _segment_name(segment)
+                end = 0
+            header = f'{kind} {user} {num} {len(text)}\n'
+            append_text(path, header + text + '\n')
+            self._add_record(kind, user, num,
+                             (segment, end + len(header), len(text)))
+            self._scanned[segment] = end + len(header) + len(text) + 1
+
+    def write_issue(self, user: str, num: int, data: Dict[str, Any]) -> None:
+        self._append('issue', user, num, data)
+
+    def add_comment(self, user: str, num: int, data: Dict[str, Any]) -> None:
+        self._append('comment', user, num, data)
+
+    def append_log(self, user: str, num: int, entry: Dict[str, Any]) -> None:
+        self._append('log', user, num, entry)
+
+
+# == SQLite ==
+
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS issues (
+    user TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user, num)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS comments (
+    user TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_issue ON comments (user, num);
+CREATE TABLE IF NOT EXISTS log (
+    user TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS log_issue ON log (user, num);
+CREATE TABLE IF NOT EXISTS tags (
+    name TEXT PRIMARY KEY
+) WITHOUT ROWID;
+'''
+
+_SQLITE_SYNCHRONOUS = {
+    Durability.FILE: 'FULL',
+    # In WAL mode this still never corrupts the database, it only
+    # risks losing the last few commits on a power failure
+    Durability.BATCH: 'NORMAL',
+    Durability.NONE: 'OFF',
+}
+
+
+class SQLiteStorage(Storage):
+    """
+    Everything in one sqlite database, including the users, ID counters
+    and the tag registry.
+    """
+
+    def __init__(self, path: Path = SQLITE_PATH) -> None:
+        self.path = path
+        # Transactions are started by hand, see _transaction()
+        self.conn = sqlite3.connect(str(path), timeout=30,
+                                    isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute(
+            f'PRAGMA synchronous = {_SQLITE_SYNCHRONOUS[DURABILITY]}')
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # IMMEDIATE takes the write lock right away, so that reads in the
+        # transaction can't be outdated by another process
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def users(self) -> List[str]:
+        return [name for name, in self.conn.execute(
+            'SELECT name FROM users UNION SELECT user FROM issues')]
+
+    def allocate_id(self, user: str) -> int:
+        with self._transaction():
+            row = self.conn.execute('SELECT next_id FROM users WHERE name = ?',
+                                    (user,)).fetchone()
+            highest = self.conn.execute(
+                'SELECT MAX(num) FROM issues WHERE user = ?',
+                (user,)).fetchone()[0] or 0
+            num = max(row[0] if row else 0, highest + 1)
+            self.conn.execute('INSERT OR REPLACE INTO users VALUES (?, ?)',
+                              (user, num + 1))
+        return num
+
+    def issue_ids(self, user: Optional[str] = None,
+                  workers: int = 1) -> List[IssueKey]:
+        if user is None:
+            rows = self.conn.execute(
+                'SELECT user, num FROM issues ORDER BY user, num')
+        else:
+            rows = self.conn.execute(
+                'SELECT user, num FROM issues WHERE user = ? ORDER BY num',
+                (user,))
+        return [(issue_user, num) for issue_user, num in rows]
+
+    def issue_exists(self, user: str, num: int) -> bool:
+        return self.conn.execute(
+            'SELECT 1 FROM issues WHERE user = ? AND num = ?',
+            (user, num)).fetchone() is not None
+
+    def read_issue(self, user: str, num: int) -> Dict[str, Any]:
+        row = self.conn.execute(
+            'SELECT data FROM issues WHERE user = ? AND num = ?',
+            (user, num)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f'No issue {user}/{num} in the database')
+        trace.count('records read')
+        trace.count('bytes read', len(row[0]))
+        data: Dict[str, Any] = json.loads(row[0])
+        return data
+
+    def write_issue(self, user: str, num: int, data: Dict[str, Any]) -> None:
+        self.conn.execute('INSERT OR REPLACE INTO issues VALUES (?, ?, ?)',
+                          (user, num, json.dumps(data)))
+
+    def comment_count(self, user: str, num: int) -> int:
+        count: int = self.conn.execute(
+            'SELECT COUNT(*) FROM comments WHERE user = ? AND num = ?',
+            (user, num)).fetchone()[0]
+        return count
+
+    def read_comments(self, user: str, num: int) -> List[Dict[str, Any]]:
+        return [json.loads(data) for data, in self.conn.execute(
+            'SELECT data FROM comments WHERE user = ? AND num = ? '
+            'ORDER BY rowid', (user, num))]
+
+    def add_comment(self, user: str, num: int, data: Dict[str, Any]) -> None:
+        self.conn.execute('INSERT INTO comments VALUES (?, ?, ?)',
+                          (user, num, json.dumps(data)))
+
+    def read_log(self, user: str, num: int) -> List[Dict[str, Any]]:
+        return [json.loads(data) for data, in self.conn.execute(
+            'SELECT data FROM log WHERE user = ? AND num = ? ORDER BY rowid',
+            (user, num))]
+
+    def append_log(self, user: str, num: int, entry: Dict[str, Any]) -> None:
+        self.conn.execute('INSERT INTO log VALUES (?, ?, ?)',
+                          (user, num, json.dumps(entry)))
+
+    def read_tags(self) -> FrozenSet[str]:
+        return frozenset(name for name, in self.conn.execute(
+            'SELECT name FROM tags'))
+
+    def write_tags(self, tags: Iterable[str]) -> None:
+        with self._transaction():
+            self.conn.execute('DELETE FROM tags')
+            self.conn.executemany('INSERT INTO tags VALUES (?)',
+                                  ((tag,) for tag in tags))
+
+
+# == Choosing and converting backends ==
+
+@functools.lru_cache(maxsize=None)
+def get_storage() -> Storage:
+    # Call get_storage.cache_clear() after packing or unpacking
+    if PACK_PATH.is_dir():
+        return PackStorage()
+    elif SQLITE_PATH.exists():
+        return SQLiteStorage()
+    return DirectoryStorage()
+
+
+@functools.lru_cache(maxsize=None)
+def user_registry() -> UserRegistry:
+    # Call user_registry.cache_clear() after adding a user
+    return UserRegistry(get_storage().users())
+
+
+def _copy_issues(source: Storage, target: Storage) -> int:
+    count = 0
+    with write_batch():
+        for user, num in source.issue_ids():
+            with issue_lock(user, num):
+                try:
+                    data = source.read_issue(user, num)
+                except FileNotFoundError:
+                    continue
+                log = source.read_log(user, num)
+                data.pop('log', None)
+                target.write_issue(user, num, data)
+                for entry in log:
+                    target.append_log(user, num, entry)
+                for comment in source.read_comments(user, num):
+                    target.add_comment(user, num, comment)
+            count += 1
+        target.write_tags(source.read_tags())
+    return count
+
+
+def _remove_path(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def pack_issues(sqlite: bool = False) -> int:
+    """
+    Move every issue from their directories into pack files, or into
+    an sqlite database if sqlite is True.
+    """
+    final_path = SQLITE_PATH if sqlite else PACK_PATH
+    new_path = final_path.with_name(final_path.name + '-new')
+    with root_lock():
+        if not isinstance(get_storage(), DirectoryStorage):
+            raise FileExistsError('Issues are already packed')
+        # Left over from an interrupted pack
+        _remove_path(new_path)
+        target: Storage
+        if sqlite:
+            target = SQLiteStorage(new_path)
+        else:
+            target = PackStorage(new_path)
+        count = _copy_issues(DirectoryStorage(), target)
+        if isinstance(target, PackStorage):
+            target.save_index()
+        target.close()
+        # This is the point where the new storage takes over
+        new_path.rename(final_path)
+        get_storage.cache_clear()
+        user_registry.cache_clear()
+        for userdir in user_paths():
+            for issue_dir in issue_dirs(userdir):
+                shutil.rmtree(issue_dir)
+        if sqlite:
+            # The database has its own users and tag registry
+            for userdir in user_paths():
+                shutil.rmtree(userdir)
+            _remove_path(TAGS_PATH)
+        # The index is only used with the directory layout
+        _remove_path(INDEX_PATH)
+    return count
+
+
+def unpack_issues() -> int:
+    """Move every packed issue back into directories."""
+    with root_lock():
+        source = get_storage()
+        if isinstance(source, DirectoryStorage):
+            raise FileNotFoundError('Issues are not packed')
+        for user, num in source.issue_ids():
+            # Left over from an interrupted unpack
+            _remove_path(issue_path(user, num).parent)
+        for user in source.users():
+            user_path(user).mkdir(parents=True, exist_ok=True)
+        count = _copy_issues(source, DirectoryStorage())
+        source.close()
+        if isinstance(source, PackStorage):
+            shutil.rmtree(PACK_PATH)
+        else:
+            SQLITE_PATH.unlink()
+        get_storage.cache_clear()
+        user_registry.cache_clear()
+    return count
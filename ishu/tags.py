@@ -0,0 +1,126 @@
+from collections import Counter
+import json
+import time
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from .common import (atomic_write_text, flush_batch, migration_lock,
+                     root_lock, TAG_MIGRATION_PATH)
+from .models import (batched_writes, Issue, IssueID, iter_issues,
+                     locked_issue, open_index)
+from .storage import get_storage
+
+
+# == Tag registry ==
+
+def load_tag_registry() -> FrozenSet[str]:
+    return get_storage().read_tags()
+
+
+def save_tag_registry(tags: Iterable[str]) -> None:
+    get_storage().write_tags(tags)
+
+
+def register_tags(tags: Iterable[str]) -> None:
+    with root_lock():
+        save_tag_registry(load_tag_registry().union(tags))
+
+
+def tag_usage() -> Counter:
+    index = open_index()
+    if index is None:
+        return Counter(t for issue in iter_issues() for t in issue.tags)
+    with index:
+        return index.tag_counts()
+
+
+def tagged_issue_ids(tags: Iterable[str]) -> List[IssueID]:
+    tags = frozenset(tags)
+    index = open_index()
+    if index is None:
+        return [issue.id_ for issue in iter_issues()
+                if not tags.isdisjoint(issue.tags)]
+    with index:
+        return [IssueID(user, num) for user, num in index.tagged(tags)]
+
+
+# == Bulk renames and removals ==
+
+class MigrationResult(NamedTuple):
+    modified: int
+    elapsed: float
+
+    @property
+    def rate(self) -> float:
+        return self.modified / self.elapsed if self.elapsed else 0.0
+
+
+class TagMigration(NamedTuple):
+    renames: Dict[str, str]
+    removals: FrozenSet[str]
+    # Issues that may still use one of the old tags
+    pending: List[IssueID]
+
+    @classmethod
+    def plan(cls, renames: Optional[Dict[str, str]] = None,
+             removals: Iterable[str] = ()) -> 'TagMigration':
+        renames = renames or {}
+        removals = frozenset(removals)
+        pending = tagged_issue_ids(removals.union(renames))
+        return cls(renames=renames, removals=removals, pending=pending)
+
+    @classmethod
+    def load(cls) -> Optional['TagMigration']:
+        if not TAG_MIGRATION_PATH.exists():
+            return None
+        data: Dict[str, Any] = json.loads(TAG_MIGRATION_PATH.read_text())
+        return cls(renames=data['renames'],
+                   removals=frozenset(data['removals']),
+                   pending=[IssueID(user=i['user'], num=i['id'])
+                            for i in data['pending']])
+
+    def save(self) -> None:
+        atomic_write_text(TAG_MIGRATION_PATH, json.dumps({
+            'renames': self.renames,
+            'removals': sorted(self.removals),
+            'pending': [{'id': i.num, 'user': i.user} for i in self.pending],
+        }))
+
+    def apply(self, issue: Issue) -> Issue:
+        tags = {self.renames.get(tag, tag) for tag in issue.tags
+                if tag not in self.removals}
+        return issue._replace(tags=tags)
+
+    def run(self, actor: Optional[str] = None,
+            checkpoint_every: int = 500) -> MigrationResult:
+        # Since apply() does nothing to already migrated issues, an
+        # interrupted migration can be resumed from the last checkpoint
+        start = time.perf_counter()
+        modified = 0
+        # Only the issue being migrated is locked, so that opening and
+        # editing other issues can go on in the meantime
+        with migration_lock():
+            with root_lock():
+                self.save()
+            with batched_writes():
+                for n, issue_id in enumerate(self.pending, 1):
+                    with locked_issue(issue_id):
+                        try:
+                            issue = Issue.load_from_id(issue_id)
+                        except FileNotFoundError:
+                            issue = None
+                        if issue is not None:
+                            migrated = self.apply(issue)
+                            if migrated.tags != issue.tags:
+                                migrated.save(actor)
+                                modified += 1
+                    if n % checkpoint_every == 0:
+                        # The issues have to be on disk before the
+                        # checkpoint that says they're done
+                        flush_batch()
+                        self._replace(pending=self.pending[n:]).save()
+            with root_lock():
+                registry = (load_tag_registry() - self.removals
+                            - set(self.renames))
+                save_tag_registry(registry.union(self.renames.values()))
+                TAG_MIGRATION_PATH.unlink()
+        return MigrationResult(modified, time.perf_counter() - start)
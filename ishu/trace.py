@@ -0,0 +1,192 @@
+"""
+Opt-in timing of where ishu spends its time, for when something is slow.
+
+Set ISHU_TRACE, or run ishu --trace[=<mode>] <command>, with one of:
+
+    summary (or 1)  time spent in each phase, and counters like the
+                    number of files and bytes read, on stderr
+    json            the same as JSON on stderr
+    profile         profile everything with cProfile, save it to
+                    ishu.prof and show the slowest functions on stderr
+    memory          show the lines that allocated the most memory, with
+                    tracemalloc, on stderr
+
+Phases nest, and are shown with the total time (including the phases in
+them) and the self time (not including them). Phases in worker threads
+are shown at the top level, and ones in worker processes aren't seen.
+
+When tracing is off, phase() and count() do next to nothing, so they can
+be used anywhere, although not in the innermost loops.
+"""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import (Any, ContextManager, Dict, Iterable, Iterator, List,
+                    Optional, Tuple, TypeVar)
+
+MODES = frozenset(['summary', 'json', 'profile', 'memory'])
+PROFILE_PATH = 'ishu.prof'
+# How many functions or lines to show in the profile and memory modes
+REPORT_LIMIT = 25
+
+T = TypeVar('T')
+
+PhasePath = Tuple[str, ...]
+
+_mode: Optional[str] = None
+# Whether phases and counters are recorded
+enabled = False
+# Calls and seconds, in the order they were first started, so that
+# every phase comes before the phases in it
+_phases: Dict[PhasePath, List[float]] = {}
+_counters: Dict[str, int] = {}
+_local = threading.local()
+_NO_PHASE: ContextManager[None] = contextlib.nullcontext()
+
+
+def configure(mode: Optional[str]) -> None:
+    """Turn tracing on with one of MODES, or off with None."""
+    global _mode, enabled
+    if mode == '1':
+        mode = 'summary'
+    if mode is not None and mode not in MODES:
+        raise ValueError(f'unknown trace mode: {mode}')
+    _mode = mode
+    enabled = mode in {'summary', 'json'}
+
+
+def active() -> bool:
+    return _mode is not None
+
+
+@contextlib.contextmanager
+def _phase(name: str) -> Iterator[None]:
+    parent: PhasePath = getattr(_local, 'path', ())
+    path = parent + (name,)
+    stats = _phases.setdefault(path, [0, 0.0])
+    _local.path = path
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start
+        _local.path = parent
+
+
+def phase(name: str) -> ContextManager[None]:
+    return _phase(name) if enabled else _NO_PHASE
+
+
+def count(name: str, amount: int = 1) -> None:
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def _timed_iter(name: str, iterator: Iterator[T]) -> Iterator[T]:
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def iterate(name: str, items: Iterable[T]) -> Iterator[T]:
+    """
+    Time getting every item from items as a phase, but not what's done
+    with the items in between, unlike a phase around the whole loop.
+    """
+    if not enabled:
+        return iter(items)
+    return _timed_iter(name, iter(items))
+
+
+# == Reporting ==
+
+def _self_seconds(path: PhasePath, seconds: float) -> float:
+    return seconds - sum(s for p, (_, s) in _phases.items()
+                         if len(p) == len(path) + 1 and p[:-1] == path)
+
+
+def _report_summary(total: float) -> None:
+    out = sys.stderr
+    width = max([len('  ' * (len(p) - 1) + p[-1]) for p in _phases]
+                + [len('phase')])
+    print(f'\n{"phase":<{width}}  {"calls":>7}  {"total (ms)":>10}  '
+          f'{"self (ms)":>10}', file=out)
+    for path, (calls, seconds) in _phases.items():
+        name = '  ' * (len(path) - 1) + path[-1]
+        print(f'{name:<{width}}  {calls:>7.0f}  {seconds * 1000:>10.1f}  '
+              f'{_self_seconds(path, seconds) * 1000:>10.1f}', file=out)
+    if _counters:
+        width = max(map(len, _counters))
+        print(file=out)
+        for name, value in _counters.items():
+            print(f'{name:<{width}}  {value:>10}', file=out)
+    print(f'\ntotal: {total * 1000:.1f} ms', file=out)
+
+
+def _report_json(total: float) -> None:
+    print(json.dumps({
+        'total_seconds': total,
+        'phases': [{'phase': list(path), 'calls': int(calls),
+                    'seconds': seconds,
+                    'self_seconds': _self_seconds(path, seconds)}
+                   for path, (calls, seconds) in _phases.items()],
+        'counters': _counters,
+    }), file=sys.stderr)
+
+
+@contextlib.contextmanager
+def tracing() -> Iterator[None]:
+    """Trace everything inside this, and report it at the end."""
+    if _mode is None:
+        yield
+        return
+    profiler: Any = None
+    if _mode == 'profile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif _mode == 'memory':
+        import tracemalloc
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        total = time.perf_counter() - start
+        if _mode == 'summary':
+            _report_summary(total)
+        elif _mode == 'json':
+            _report_json(total)
+        elif _mode == 'profile':
+            import pstats
+            profiler.disable()
+            profiler.dump_stats(PROFILE_PATH)
+            print(f'\nProfile saved to {os.path.abspath(PROFILE_PATH)}',
+                  file=sys.stderr)
+            pstats.Stats(profiler, stream=sys.stderr) \
+                .sort_stats('cumulative').print_stats(REPORT_LIMIT)
+        elif _mode == 'memory':
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f'\ncurrent: {current / 1e6:.1f} MB, '
+                  f'peak: {peak / 1e6:.1f} MB', file=sys.stderr)
+            for stat in snapshot.statistics('lineno')[:REPORT_LIMIT]:
+                print(stat, file=sys.stderr)
+
+
+_env_mode = os.environ.get('ISHU_TRACE', '')
+if _env_mode not in {'', '0'}:
+    try:
+        configure(_env_mode)
+    except ValueError:
+        # Better than not tracing at all
+        configure('summary')